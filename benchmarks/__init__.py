@@ -0,0 +1 @@
+"""Offline benchmarks of the bot's hot paths. Run from the repository root, e.g. python -m benchmarks.bench_fixture_model"""
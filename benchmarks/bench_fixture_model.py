@@ -0,0 +1,113 @@
+"""
+Compares parsing time and memory of the compact Fixture model against the previous dict-based model, using the
+fixtures stored in fixtures.json replicated over several seasons.
+"""
+import json
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import List, Callable
+
+import fixture_store
+import fixtures
+
+SEASONS = 10
+REPEATS = 5
+
+
+class LegacyFixture:
+    """The dict-backed fixture model and parser that the compact Fixture replaced, kept as a baseline."""
+
+    def __init__(self, fixture_string: str, player_names: List[str]):
+        self.home_team: str = ""
+        self.away_team: str = ""
+        self.match_datetime: datetime = None
+        self.predictions_dict = {x: "" for x in player_names}
+        self.result = ""
+        self.id: str = ""
+        self.parse_fixture_string(fixture_string)
+
+    def parse_fixture_string(self, string) -> None:
+        tokens = string.split("  ")
+        tokens = [x.strip() for x in tokens]
+        for index, token in enumerate(tokens):
+            if index == 0:
+                self.home_team = token
+            elif index == 1 and token.isnumeric():
+                self.result = f"{token}:{tokens[3]}"
+                self.away_team = tokens[2]
+            elif index == 1 and not token.isnumeric():
+                self.away_team = token
+            elif index == 2 and ":" in token:
+                now = datetime.today()
+                self.match_datetime = now.strftime("%d/%m/%Y") + token.strip()
+                self.match_datetime = datetime.strptime(self.match_datetime, "%d/%m/%Y%H:%M")
+            elif index == 2 and "Postponed" in token:
+                self.match_datetime = datetime(1, 1, 1)
+            elif index == 2 and "/" in token:
+                self.match_datetime = datetime.strptime(token.strip() + " " + tokens[3].strip(), "%d/%m/%Y %H:%M")
+            elif index == 2 and "Tomorrow" in token:
+                now = datetime.today() + timedelta(days=1)
+                self.match_datetime = now.strftime("%d/%m/%Y") + tokens[3].strip()
+                self.match_datetime = datetime.strptime(self.match_datetime, "%d/%m/%Y%H:%M")
+            elif index == 4 and ("'" in token or "Half time" in token or "Today" in token):
+                now = datetime.today()
+                self.match_datetime = now.strftime("%d/%m/%Y")
+                self.match_datetime = datetime.strptime(self.match_datetime, "%d/%m/%Y")
+            elif index == 4 and "/" in token:
+                self.match_datetime = datetime.strptime(token, "%d/%m/%Y")
+            elif index == 4 and "Yesterday" in token:
+                now = datetime.today() + timedelta(days=1)
+                self.match_datetime = now.strftime("%d/%m/%Y")
+                self.match_datetime = datetime.strptime(self.match_datetime, "%d/%m/%Y")
+        self.id = self.home_team[:2] + self.away_team[:2] + str(self.match_datetime.day) + str(self.match_datetime.month)
+
+
+def card_strings(records: List[fixture_store.FixtureRecord], seasons: int) -> List[str]:
+    """Rebuilds the match card texts of the passed fixtures, shifted by one year per season."""
+    strings = []
+    for season in range(seasons):
+        for record in records:
+            match_datetime = record.match_datetime.replace(year=record.match_datetime.year + season)
+            if record.result:
+                home_goals, away_goals = record.result.split(":")
+                strings.append(f"{record.home_team}  {home_goals}  {record.away_team}  {away_goals}  "
+                               f"{match_datetime.strftime('%d/%m/%Y')}")
+            else:
+                strings.append(f"{record.home_team}  {record.away_team}  "
+                               f"{match_datetime.strftime('%d/%m/%Y')}  {match_datetime.strftime('%H:%M')}")
+    return strings
+
+
+def measure(factory: Callable[[str], object], strings: List[str]) -> dict:
+    """Returns the best parse time over REPEATS runs and the memory held by the parsed objects."""
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        parsed = [factory(x) for x in strings]
+        best = min(best, time.perf_counter() - start)
+        del parsed
+    tracemalloc.start()
+    parsed = [factory(x) for x in strings]
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del parsed
+    return {"parse_seconds": round(best, 6), "held_bytes": held}
+
+
+def main():
+    records = fixture_store.read_legacy_fixtures(fixture_store.LEGACY_FIXTURES_FILE)
+    player_names = sorted({name for record in records for name in record.predictions})
+    for name in player_names:
+        fixtures.player_slots.add(name)
+    strings = card_strings(records, SEASONS)
+    legacy = measure(lambda x: LegacyFixture(x, player_names), strings)
+    compact = measure(fixtures.Fixture, strings)
+    print(json.dumps({"benchmark": "fixture_model", "fixtures": len(strings), "players": len(player_names),
+                      "legacy": legacy, "compact": compact,
+                      "parse_speedup": round(legacy["parse_seconds"] / compact["parse_seconds"], 2),
+                      "memory_ratio": round(compact["held_bytes"] / legacy["held_bytes"], 3)}, indent=4))
+
+
+if __name__ == "__main__":
+    main()
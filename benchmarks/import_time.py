@@ -0,0 +1,85 @@
+"""
+Import-time report of the bot's cold start.
+
+Imports main in fresh interpreters with -X importtime and reports as JSON:
+- the median time of importing main
+- the slowest modules it imports
+- what importing the deferred scraping, parsing and scoring dependencies at startup would add
+
+Example:
+    python -m benchmarks.import_time --runs 5 --output import_time.json
+"""
+import argparse
+import json
+import platform
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List
+
+from main import DEFERRED_IMPORTS
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_times(statement: str) -> Dict[str, int]:
+    """
+    Runs statement in a fresh interpreter and returns the cumulative import time in microseconds of every module,
+    with top level imports keyed by their name and nested ones by their name prefixed with ">".
+    """
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=ROOT_DIRECTORY,
+                             capture_output=True, text=True, check=True)
+    times = {}
+    for line in process.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        nested = name.startswith("  ")
+        times[(">" if nested else "") + name.strip()] = int(cumulative)
+    return times
+
+
+def median_times(statement: str, runs: int) -> Dict[str, float]:
+    """Median import time of every module over the passed number of runs of statement."""
+    samples: Dict[str, List[int]] = defaultdict(list)
+    for _ in range(runs):
+        for name, value in import_times(statement).items():
+            samples[name].append(value)
+    return {name: statistics.median(values) for name, values in samples.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="Write the report to this file instead of stdout")
+    args = parser.parse_args()
+    startup = median_times("import main", args.runs)
+    eager = median_times(f"import main; import {', '.join(DEFERRED_IMPORTS)}", args.runs)
+    deferred = {name: value for name, value in eager.items() if not name.startswith(">") and name not in startup}
+    report = {
+        "suite": "premierLeaguePythonBot import time",
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "runs": args.runs,
+        "startup_ms": round(startup["main"] / 1000, 1),
+        "deferred_ms": round(sum(deferred.values()) / 1000, 1),
+        "eager_startup_ms": round((startup["main"] + sum(deferred.values())) / 1000, 1),
+        "deferred_modules_ms": {name: round(value / 1000, 1) for name, value in deferred.items()},
+        "slowest_modules_ms": {name.lstrip(">"): round(value / 1000, 1)
+                               for name, value in sorted(startup.items(), key=lambda x: -x[1])[:args.top]},
+    }
+    text = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Offline benchmark suite of the scrape, parse, store, score and render pipeline.
+
+HTTP requests are answered by an httpx.MockTransport that replays the skysports and onefootball pages in the recordings
+directory, skysports_table.html and onefootball_fixtures.html. The committed ones are hand-built stand-ins written after
+the sites' markup, not captures of the real pages, so they do not prove the parsers against the live sites; pages saved
+from the real sites under the same names replace them. Without them, e.g. with --recordings pointing elsewhere, pages
+of the same markup are generated. Leagues, players and seasons are synthetic and seeded, and the bot's state files are
+redirected to a temporary directory, so the working directory is never touched.
+
+Reports per-stage latency, throughput and peak memory as JSON, e.g.
+    python -m benchmarks.run --players 5000 --seasons 3 --output bench_output.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Callable, List
+
+import httpx
+
+import fixture_refresher
+import fixture_store
+import fixtures
+import http_client
+import json_readers
+import player
+import scoring
+import settlement
+import sources
+import state_persistence
+import telegram_messaging
+import web_scrapping
+from benchmarks import synthetic
+
+RECORDINGS_DIRECTORY = os.path.join(os.path.dirname(__file__), "recordings")
+SKYSPORTS_RECORDING = "skysports_table.html"
+ONEFOOTBALL_RECORDING = "onefootball_fixtures.html"
+
+
+def read_recording(directory: str, file_name: str, fallback: str) -> str:
+    """Returns the page saved in the recordings directory, if any, else the generated fallback."""
+    try:
+        with open(os.path.join(directory, file_name), encoding="utf8") as file:
+            return file.read()
+    except (IOError, FileNotFoundError):
+        return fallback
+
+
+def replay_transport(pages: dict) -> httpx.MockTransport:
+    """A transport answering every request for a known url with its page."""
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        page = pages.get(str(request.url))
+        if page is None:
+            return httpx.Response(404)
+        return httpx.Response(200, content=page.encode("utf8"), headers={"Content-Type": "text/html"})
+
+    return httpx.MockTransport(handler)
+
+
+def run_stage(name: str, func: Callable[[], object], items: int, iterations: int) -> dict:
+    """Times func over the passed iterations, then measures its peak memory in one traced run."""
+    func()  # Warm up caches and lazy imports
+    timings: List[float] = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    timings.sort()
+    median = statistics.median(timings)
+    return {
+        "stage": name,
+        "iterations": iterations,
+        "items": items,
+        "latency_ms": {
+            "min": round(timings[0] * 1000, 3),
+            "median": round(median * 1000, 3),
+            "p95": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1000, 3),
+            "max": round(timings[-1] * 1000, 3),
+        },
+        "throughput_per_s": round(items / median, 1) if median > 0 else None,
+        "peak_bytes": peak,
+    }
+
+
+def settle_all(fixtures_list: List[fixtures.Fixture]) -> "settlement.Standings":
+    """Settles every fixture from scratch and computes the standings of every player."""
+    engine = settlement.SettlementEngine()
+    engine.settle(fixtures_list, datetime.max)
+    return engine.standings()
+
+
+def run_suite(players: int, seasons: int, iterations: int, seed: int, recordings: str, work_directory: str) -> dict:
+    rng = random.Random(seed)
+    real_table = synthetic.league_table(rng)
+    tables = synthetic.player_tables(rng, players)
+    data = synthetic.player_data(tables, rng)
+    matches = [match for season in range(seasons) for match in synthetic.season_fixtures(rng, 2022 + season)]
+    current_season = matches[-len(synthetic.TEAMS) * (len(synthetic.TEAMS) - 1):]
+
+    # Redirect the bot's state to the work directory
+    player_data_file = os.path.join(work_directory, "player_data.json")
+    player_tables_file = os.path.join(work_directory, "player_tables.json")
+    with open(player_data_file, "w") as file:
+        json.dump(data, file)
+    with open(player_tables_file, "w") as file:
+        json.dump(tables, file)
+    json_readers.player_registry = json_readers.PlayerRegistry(player_data_file, player_tables_file)
+    fixtures.player_slots = fixtures.PlayerSlots()
+    fixtures._store = fixture_store.FixtureStore(os.path.join(work_directory, "fixtures.db"))
+    fixtures._journal = state_persistence.Journal(os.path.join(work_directory, "predictions.journal"))
+    fixtures._set_index(None)
+
+    skysports_page = read_recording(recordings, SKYSPORTS_RECORDING, synthetic.skysports_table_page(real_table))
+    onefootball_page = read_recording(recordings, ONEFOOTBALL_RECORDING,
+                                      synthetic.onefootball_fixtures_page(current_season))
+    # Every registered competition replays the same pages, so that refreshes cover as many sources as the bot has
+    fixture_sources = sources.registry.enabled(sources.FIXTURES)
+    http_client.use_transport(replay_transport(
+        {x.url: onefootball_page if x.kind == sources.FIXTURES else skysports_page for x in sources.registry}))
+    loop = asyncio.new_event_loop()
+
+    card_strings = [synthetic.card_string(*match) for match in matches]
+    stored_fixtures = [fixtures.Fixture(x) for x in card_strings]
+    scraped_fixtures = fixtures.parse_fixtures_page(onefootball_page.encode("utf8"))
+    for fixture in stored_fixtures[::7]:
+        fixture.predictions_dict[rng.choice(list(tables))] = rng.choice(synthetic.PREDICTIONS[1:])
+    fixtures.write_fixtures(stored_fixtures)
+    names = list(tables)
+    busiest_day = max(stored_fixtures, key=lambda x: sum(y.match_datetime.date() == x.match_datetime.date()
+                                                         for y in stored_fixtures[:200])).match_datetime
+    update = SimpleNamespace(message=SimpleNamespace(from_user={"id": data[names[0]]["user_id"]}),
+                             effective_chat=SimpleNamespace(id=None))
+
+    stages = [
+        run_stage("web_scrape_table", lambda: loop.run_until_complete(web_scrapping.web_scrape_table()),
+                  1, iterations),
+        run_stage("refresh_fixture_sources",
+                  lambda: loop.run_until_complete(fixture_refresher.FixtureRefresher(fixture_sources).refresh()),
+                  len(scraped_fixtures) * len(fixture_sources), iterations),
+        run_stage("parse_fixtures_page", lambda: fixtures.parse_fixtures_page(onefootball_page.encode("utf8")),
+                  len(scraped_fixtures), iterations),
+        run_stage("parse_fixture_string", lambda: [fixtures.Fixture(x) for x in card_strings],
+                  len(card_strings), iterations),
+        run_stage("sync_old_and_new_fixtures",
+                  lambda: fixtures.sync_old_and_new_fixtures(list(stored_fixtures), scraped_fixtures),
+                  len(stored_fixtures) + len(scraped_fixtures), iterations),
+        run_stage("calculate_score", lambda: [player.Player(name, tables[name], data[name]["changes"], real_table,
+                                                            data[name]["score"], data[name]["user_id"])
+                                              for name in names],
+                  players, iterations),
+        run_stage("score_tables", lambda: scoring.score_players(data, tables, real_table), players, iterations),
+        run_stage("create_player_objects", lambda: player.create_player_objects(data, tables, real_table),
+                  players, iterations),
+        run_stage("write_fixtures", lambda: fixtures.write_fixtures(stored_fixtures),
+                  len(stored_fixtures), iterations),
+        run_stage("load_fixtures", fixtures.load_fixtures, len(stored_fixtures), iterations),
+        run_stage("settle_predictions", lambda: settle_all(stored_fixtures), len(stored_fixtures), iterations),
+        run_stage("generate_fixture_keyboard_markup",
+                  lambda: telegram_messaging.generate_fixture_keyboard_markup(update, busiest_day),
+                  len(fixtures.fixtures_of_day(busiest_day)), iterations),
+        run_stage("render_fixture_keyboard_markup",
+                  lambda: telegram_messaging.render_fixture_keyboard_markup(
+                      telegram_messaging.select_fixtures(busiest_day), names[0], busiest_day),
+                  len(fixtures.fixtures_of_day(busiest_day)), iterations),
+    ]
+    loop.run_until_complete(http_client.close_client())
+    sources.close_pool()
+    loop.close()
+    http_client.use_transport(None)
+    return {
+        "suite": "premierLeaguePythonBot",
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": {"players": players, "seasons": seasons, "fixtures": len(stored_fixtures),
+                       "iterations": iterations, "seed": seed,
+                       "replayed_pages": sorted(x for x in (SKYSPORTS_RECORDING, ONEFOOTBALL_RECORDING)
+                                                if os.path.exists(os.path.join(recordings, x)))},
+        "stages": stages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=2000)
+    parser.add_argument("--seasons", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=2022)
+    parser.add_argument("--recordings", default=RECORDINGS_DIRECTORY)
+    parser.add_argument("--output", help="Write the report to this file instead of stdout")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as work_directory:
+        report = run_suite(args.players, args.seasons, args.iterations, args.seed, args.recordings, work_directory)
+    text = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
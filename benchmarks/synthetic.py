@@ -0,0 +1,74 @@
+"""Generators of synthetic leagues, seasons of fixtures and pages shaped like the scraped skysports and onefootball ones."""
+import random
+from datetime import datetime, timedelta
+from html import escape
+from typing import List, Dict, Tuple
+
+TEAMS = ["Arsenal", "Aston Villa", "Bournemouth", "Brentford", "Brighton and Hove Albion", "Chelsea", "Crystal Palace",
+         "Everton", "Fulham", "Leeds United", "Leicester City", "Liverpool", "Manchester City", "Manchester United",
+         "Newcastle United", "Nottingham Forest", "Southampton", "Tottenham Hotspur", "West Ham United",
+         "Wolverhampton Wanderers"]
+PREDICTIONS = ["", "1", "X", "2"]
+
+
+def league_table(rng: random.Random) -> List[str]:
+    """A random final standing of TEAMS."""
+    return rng.sample(TEAMS, len(TEAMS))
+
+
+def player_tables(rng: random.Random, players: int) -> Dict[str, List[str]]:
+    """Predicted tables of the passed number of players, shaped like player_tables.json."""
+    return {f"player{index:05d}": league_table(rng) for index in range(players)}
+
+
+def player_data(tables: Dict[str, List[str]], rng: random.Random) -> Dict[str, dict]:
+    """Scores, changes and user ids of the passed players, shaped like player_data.json."""
+    return {name: {"score": rng.randint(80, 200), "changes": rng.randint(0, 3), "user_id": 1000 + index}
+            for index, name in enumerate(tables)}
+
+
+def season_fixtures(rng: random.Random, first_year: int) -> List[Tuple[str, str, datetime, str]]:
+    """A double round robin of TEAMS as (home, away, kickoff, result) tuples, ten matches per weekend day."""
+    pairs = [(home, away) for home in TEAMS for away in TEAMS if home != away]
+    rng.shuffle(pairs)
+    start = datetime(first_year, 8, 6, 15, 0)
+    matches = []
+    for index, (home, away) in enumerate(pairs):
+        kickoff = start + timedelta(days=7 * (index // 10) + (index % 10) // 5, hours=(index % 5) // 2 * 2)
+        result = f"{rng.randint(0, 4)}:{rng.randint(0, 4)}" if rng.random() < 0.5 else ""
+        matches.append((home, away, kickoff, result))
+    return matches
+
+
+def card_string(home: str, away: str, kickoff: datetime, result: str) -> str:
+    """The flattened text of a match card, as parse_fixture_string receives it."""
+    if result:
+        home_goals, away_goals = result.split(":")
+        return f"{home}  {home_goals}  {away}  {away_goals}  {kickoff.strftime('%d/%m/%Y')}"
+    return f"{home}  {away}  {kickoff.strftime('%d/%m/%Y')}  {kickoff.strftime('%H:%M')}"
+
+
+def skysports_table_page(table: List[str]) -> str:
+    """A league table page with the column layout that web_scrapping.parse_table_html expects."""
+    header = "<tr>" + "".join(f"<th>{x}</th>" for x in ["#", "Team", "Pl", "W", "D", "L", "F", "A", "GD", "Pts",
+                                                         "Last 6"]) + "</tr>"
+    rows = "".join(f"<tr><td>{position + 1}</td><td>{escape(team)}</td>" + "<td>0</td>" * 8 + "<td></td></tr>"
+                   for position, team in enumerate(table))
+    return f"<html><head><title>Premier League Table</title></head><body><table>{header}{rows}</table></body></html>"
+
+
+def onefootball_fixtures_page(matches: List[Tuple[str, str, datetime, str]]) -> str:
+    """A fixtures page with the match card markup that fixtures.iter_fixtures expects."""
+    cards = []
+    for home, away, kickoff, result in matches:
+        scores = result.split(":") if result else ["", ""]
+        teams = "".join(f'<div class="simple-match-card-team"><img src="/logo.png" alt="">'
+                        f'<span class="simple-match-card-team__name">{escape(team)}</span>'
+                        f'<span class="simple-match-card-team__score">{score}</span></div>'
+                        for team, score in ((home, scores[0]), (away, scores[1])))
+        cards.append(f'<li class="simple-match-cards-list__match-card"><a href="/en/match/1">'
+                     f'<article class="simple-match-card"><div class="simple-match-card__teams">{teams}</div>'
+                     f'<div class="simple-match-card__match-info"><time datetime="{kickoff.isoformat()}">'
+                     f'{kickoff.strftime("%d/%m/%Y")}</time></div></article></a></li>')
+    return f"<html><head><title>Fixtures</title></head><body><ul class=\"simple-match-cards-list\">" \
+           f"{''.join(cards)}</ul></body></html>"
@@ -0,0 +1,51 @@
+"""Typed configuration of the bot, read once from 'keys.json'."""
+import json
+from typing import NamedTuple, Optional, Tuple
+
+KEYS_FILE = 'keys.json'
+
+_keys: Optional[dict] = None
+_config: Optional["Config"] = None
+
+
+class Config(NamedTuple):
+    """Settings of the bot. Keys missing from 'keys.json' take these defaults."""
+    bot_token: Optional[str] = None
+    group_chat_id: Optional[int] = None  # Chat of the default league
+    metrics_port: Optional[int] = None  # Local port of the metrics endpoint, disabled if not set
+    profiler_enabled: bool = False  # Runs the sampling profiler from startup
+    warm_caches: bool = True  # Loads deferred dependencies and caches in the background once polling started
+    sources: Optional[Tuple[str, ...]] = None  # Names of the scraped sources, every registered one if not set
+
+    @classmethod
+    def from_keys(cls, keys: dict) -> "Config":
+        """Builds the config from the contents of 'keys.json'."""
+        defaults = cls()
+        return cls(
+            bot_token=keys.get("BOT_TOKEN", defaults.bot_token),
+            group_chat_id=int(keys["GROUP_CHAT_ID"]) if keys.get("GROUP_CHAT_ID") is not None else None,
+            metrics_port=int(keys["METRICS_PORT"]) if keys.get("METRICS_PORT") else None,
+            profiler_enabled=bool(keys.get("PROFILER_ENABLED", defaults.profiler_enabled)),
+            warm_caches=bool(keys.get("WARM_CACHES", defaults.warm_caches)),
+            sources=tuple(keys["SOURCES"]) if keys.get("SOURCES") is not None else None,
+        )
+
+
+def read_keys(path: str = KEYS_FILE) -> dict:
+    """Reads 'keys.json' on first call and returns its contents, or an empty dict if it cannot be read."""
+    global _keys
+    if _keys is None:
+        try:
+            with open(path, 'r') as read_file:
+                _keys = json.load(read_file)
+        except (IOError, FileNotFoundError, json.decoder.JSONDecodeError):
+            _keys = {}
+    return _keys
+
+
+def get_config() -> Config:
+    """Returns the bot's config, reading it on first call."""
+    global _config
+    if _config is None:
+        _config = Config.from_keys(read_keys())
+    return _config
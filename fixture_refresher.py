@@ -0,0 +1,135 @@
+"""Background job that keeps the fixture store in sync with the fixtures pages of every enabled source."""
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from telegram import ext
+
+import fixtures
+import http_client
+import metrics
+import sources
+
+LIVE_REFRESH_INTERVAL = 60  # Seconds between refreshes while a match is being played
+MATCHDAY_REFRESH_INTERVAL = 10 * 60  # Seconds between refreshes on a day with matches
+IDLE_REFRESH_INTERVAL = 6 * 60 * 60  # Seconds between refreshes otherwise
+MATCH_DURATION = fixtures.MATCH_DURATION
+
+FIXTURE_REFRESHES = metrics.counter("fixture_refreshes",
+                                    "Fixture source refreshes by outcome: not_modified, unchanged, applied or failed.")
+
+
+class SourceState:
+    """Validators of the last response of a source and the digest of its last applied body."""
+    __slots__ = ("etag", "last_modified", "content_hash")
+
+    def __init__(self):
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self.content_hash: Optional[str] = None
+
+
+class FixtureRefresher:
+    """
+    Polls the fixtures pages of every enabled source and applies only what changed to the fixture store.
+
+    Sources are fetched and parsed concurrently and their fixtures applied in one write, so a refresh takes about as
+    long as the slowest source. Unchanged pages are skipped without parsing, either because the server answers a
+    conditional request with 304 Not Modified or because the body hashes to the same digest as the last parsed one.
+    A failing source is logged and skipped without holding back the others.
+    """
+
+    def __init__(self, fixture_sources: List[sources.Source] = None):
+        self.sources: List[sources.Source] = \
+            fixture_sources if fixture_sources is not None else sources.registry.enabled(sources.FIXTURES)
+        self.states: Dict[str, SourceState] = {x.name: SourceState() for x in self.sources}
+
+    async def refresh(self) -> int:
+        """Fetches every source and applies changed fixtures to the store. Returns the number of written fixtures."""
+        results = await asyncio.gather(*(self._scrape(x) for x in self.sources), return_exceptions=True)
+        scraped: List[fixtures.Fixture] = []
+        responses: Dict[str, SourceState] = {}
+        for source, result in zip(self.sources, results):
+            if isinstance(result, Exception):  # Whatever a single source's fetch or extractor raised
+                FIXTURE_REFRESHES.inc(outcome="failed", source=source.name)
+                http_client.SCRAPE_FAILURES.inc(source=source.name)
+                logging.error(f"Fixture refresh of {source.name} failed.", exc_info=result)
+            elif isinstance(result, BaseException):  # Cancellation and interrupts stop the whole refresh
+                raise result
+            elif result is not None:
+                responses[source.name] = result[0]
+                scraped.extend(sources.to_fixtures(result[1]))
+        if not responses:
+            return 0
+        reconciliation = await asyncio.to_thread(fixtures.apply_scraped_fixtures, scraped)
+        # Validators are kept only once the page is applied, else a failed apply would be answered 304 from then on
+        for name, state in responses.items():
+            self.states[name] = state
+            FIXTURE_REFRESHES.inc(outcome="applied", source=name)
+        if reconciliation.inserted or reconciliation.updated:
+            logging.info(f"Fixture refresh inserted {len(reconciliation.inserted)}, updated "
+                         f"{len(reconciliation.updated)} and left {len(reconciliation.unchanged)} fixtures unchanged.")
+        return len(reconciliation.inserted) + len(reconciliation.updated)
+
+    async def _scrape(self, source: sources.Source) -> Optional[Tuple[SourceState, List[fixtures.FixtureRecord]]]:
+        """
+        The state to keep once the source's page is applied and its fixture records, or None if the page did not
+        change since the last applied one.
+        """
+        state = self.states[source.name]
+        response = await http_client.fetch_if_modified(source.url, state.etag, state.last_modified)
+        if response is None:
+            FIXTURE_REFRESHES.inc(outcome="not_modified", source=source.name)
+            return None
+        new_state = SourceState()
+        new_state.etag = response.headers.get("ETag")
+        new_state.last_modified = response.headers.get("Last-Modified")
+        new_state.content_hash = hashlib.sha256(response.content).hexdigest()
+        if new_state.content_hash == state.content_hash:
+            FIXTURE_REFRESHES.inc(outcome="unchanged", source=source.name)
+            self.states[source.name] = new_state  # Same body as the applied one, so its validators are safe to keep
+            return None
+        return new_state, await sources.extract(source, response.content)
+
+    @staticmethod
+    def next_interval(now: datetime = None) -> float:
+        """Seconds until the next refresh: short while matches are live, longer on matchdays, long otherwise."""
+        now = now if now is not None else fixtures.now()
+        todays_fixtures = fixtures.fixtures_of_day(now)
+        if any(x.match_datetime <= now <= x.match_datetime + MATCH_DURATION
+               for x in todays_fixtures if fixtures.has_kickoff_time(x.match_datetime)):
+            return LIVE_REFRESH_INTERVAL
+        if todays_fixtures:
+            return MATCHDAY_REFRESH_INTERVAL
+        return IDLE_REFRESH_INTERVAL
+
+
+def settle_fixtures() -> int:
+    """
+    Scores the predictions of fixtures settled since the last refresh and archives them in the season history.
+    Returns the number of newly settled fixtures.
+    """
+    import history  # Their NumPy dependency is loaded on the first refresh, not at startup
+    import settlement
+    history.archive.archive_settled(list(fixtures.get_index().by_key.values()))
+    return settlement.settle_indexed_fixtures()
+
+
+async def refresh_fixtures_job(context: ext.ContextTypes.DEFAULT_TYPE) -> None:
+    """Job that refreshes the fixtures and schedules its next run according to the match schedule."""
+    refresher: FixtureRefresher = context.job.data
+    try:
+        await refresher.refresh()
+        await asyncio.to_thread(settle_fixtures)
+    finally:
+        interval = await asyncio.to_thread(refresher.next_interval)
+        context.job_queue.run_once(refresh_fixtures_job, when=interval, data=refresher, name=context.job.name)
+
+
+def schedule_fixture_refresh(job_queue: ext.JobQueue, first: float = 0) -> FixtureRefresher:
+    """Schedules the first background fixture refresh on the passed job queue."""
+    refresher = FixtureRefresher()
+    job_queue.run_once(refresh_fixtures_job, when=first, data=refresher, name="fixture_refresh")
+    return refresher
@@ -0,0 +1,170 @@
+"""SQLite storage backend for fixtures and per-player predictions."""
+import base64
+import json
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, NamedTuple, Dict, Iterable, Tuple
+
+FIXTURES_DB_FILE = 'fixtures.db'
+LEGACY_FIXTURES_FILE = 'fixtures.json'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fixtures (
+    key TEXT PRIMARY KEY,
+    home_team TEXT NOT NULL,
+    away_team TEXT NOT NULL,
+    match_datetime TEXT NOT NULL,
+    result TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS fixtures_match_datetime ON fixtures (match_datetime);
+CREATE TABLE IF NOT EXISTS predictions (
+    fixture_key TEXT NOT NULL REFERENCES fixtures (key),
+    player TEXT NOT NULL,
+    prediction TEXT NOT NULL,
+    PRIMARY KEY (fixture_key, player)
+);
+"""
+
+
+def fixture_key(home_team: str, away_team: str, match_datetime: datetime) -> str:
+    """Identity of a fixture across seasons and competitions: its date, including the year, and its teams."""
+    return f"{match_datetime.date().isoformat()} {home_team} - {away_team}"
+
+
+class FixtureRecord(NamedTuple):
+    """Storage representation of a fixture and the non-empty predictions made on it."""
+    key: str  # fixture_key of the fixture
+    home_team: str
+    away_team: str
+    match_datetime: datetime
+    result: str
+    predictions: Dict[str, str]
+
+
+def _to_db_datetime(value: datetime) -> str:
+    return value.isoformat(sep=" ")
+
+
+def _from_db_datetime(value: str) -> datetime:
+    return datetime.fromisoformat(value)
+
+
+class FixtureStore:
+    """Fixtures table keyed by fixture_key and indexed by match datetime, with one row per player prediction."""
+
+    def __init__(self, path: str = FIXTURES_DB_FILE):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Per-thread connection, created and initialised on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path)
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def close(self) -> None:
+        """Closes the connection of the calling thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def is_empty(self) -> bool:
+        """True if no fixtures are stored."""
+        return self.connection.execute("SELECT 1 FROM fixtures LIMIT 1").fetchone() is None
+
+    def upsert_fixtures(self, records: Iterable[FixtureRecord], moves: Iterable[Tuple[str, str]] = ()) -> None:
+        """
+        Inserts or updates the passed fixtures along with their non-empty predictions in one transaction. For every
+        (old key, new key) move, the predictions of the old key are moved to the new one and the old fixture removed.
+        """
+        records = list(records)
+        moves = list(moves)
+        with self.connection as connection:
+            connection.executemany(
+                "INSERT INTO fixtures (key, home_team, away_team, match_datetime, result) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET home_team = excluded.home_team, away_team = excluded.away_team, "
+                "match_datetime = excluded.match_datetime, result = excluded.result",
+                [(x.key, x.home_team, x.away_team, _to_db_datetime(x.match_datetime), x.result) for x in records])
+            connection.executemany(
+                "INSERT INTO predictions (fixture_key, player, prediction) VALUES (?, ?, ?) "
+                "ON CONFLICT (fixture_key, player) DO UPDATE SET prediction = excluded.prediction",
+                [(x.key, player, prediction) for x in records for player, prediction in x.predictions.items()
+                 if prediction != ""])
+            connection.executemany("UPDATE OR REPLACE predictions SET fixture_key = ? WHERE fixture_key = ?",
+                                   [(new_key, old_key) for old_key, new_key in moves])
+            connection.executemany("DELETE FROM fixtures WHERE key = ?", [(old_key,) for old_key, _ in moves])
+
+    def set_predictions(self, predictions: Iterable[Tuple[str, str, str]]) -> None:
+        """Inserts or updates a batch of (fixture key, player, prediction) rows in one transaction."""
+        with self.connection as connection:
+            connection.executemany(
+                "INSERT INTO predictions (fixture_key, player, prediction) VALUES (?, ?, ?) "
+                "ON CONFLICT (fixture_key, player) DO UPDATE SET prediction = excluded.prediction",
+                list(predictions))
+
+    def _query(self, where: str = "", parameters: tuple = ()) -> List[FixtureRecord]:
+        rows = self.connection.execute(
+            f"SELECT key, home_team, away_team, match_datetime, result FROM fixtures {where} "
+            f"ORDER BY match_datetime", parameters).fetchall()
+        predictions: Dict[str, Dict[str, str]] = {row[0]: {} for row in rows}
+        for key, player, prediction in self.connection.execute(
+                f"SELECT fixture_key, player, prediction FROM predictions "
+                f"WHERE fixture_key IN (SELECT key FROM fixtures {where})", parameters):
+            predictions[key][player] = prediction
+        return [FixtureRecord(row[0], row[1], row[2], _from_db_datetime(row[3]), row[4], predictions[row[0]])
+                for row in rows]
+
+    def load_fixtures(self) -> List[FixtureRecord]:
+        """Returns all stored fixtures sorted by match datetime."""
+        return self._query()
+
+    def migrate_from_json(self, path: str = LEGACY_FIXTURES_FILE) -> int:
+        """Imports a jsonpickle 'fixtures.json' file into the store and returns the number of imported fixtures."""
+        records = read_legacy_fixtures(path)
+        self.upsert_fixtures(records)
+        return len(records)
+
+
+def _decode_legacy_datetime(value) -> datetime:
+    """Decodes a jsonpickle encoded datetime, which stores the pickled state of the datetime in base64."""
+    if isinstance(value, dict) and "__reduce__" in value:
+        return datetime(base64.b64decode(value["__reduce__"][1][0]))
+    raise ValueError(f"Unsupported datetime encoding: {value}")
+
+
+def read_legacy_fixtures(path: str = LEGACY_FIXTURES_FILE) -> List[FixtureRecord]:
+    """Reads a jsonpickle 'fixtures.json' file into fixture records."""
+    with open(path, encoding="utf8") as file:
+        content = file.read()
+    if not content.strip():
+        return []
+    entries = json.loads(content) or []
+    try:
+        return [FixtureRecord(fixture_key(x["home_team"], x["away_team"], match_datetime), x["home_team"],
+                              x["away_team"], match_datetime, x["result"], x["predictions_dict"])
+                for x, match_datetime in ((x, _decode_legacy_datetime(x["match_datetime"])) for x in entries)]
+    except (KeyError, IndexError, TypeError, ValueError):
+        # Entries using jsonpickle references (py/id) are resolved by jsonpickle itself, into plain objects, as the
+        # slots and properties of today's fixtures.Fixture cannot be restored from the old pickled state.
+        import jsonpickle
+        for entry in entries:
+            if isinstance(entry, dict) and entry.get("py/object") == "fixtures.Fixture":
+                entry["py/object"] = f"{__name__}.{LegacyFixture.__name__}"
+        return [FixtureRecord(fixture_key(x.home_team, x.away_team, x.match_datetime), x.home_team, x.away_team,
+                              x.match_datetime, x.result, x.predictions_dict)
+                for x in jsonpickle.Unpickler().restore(entries) or []]
+
+
+class LegacyFixture:
+    """Plain attribute holder that the fixtures of a jsonpickle 'fixtures.json' file are restored into."""
+    home_team: str
+    away_team: str
+    match_datetime: datetime
+    result: str
+    predictions_dict: Dict[str, str]
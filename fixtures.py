@@ -1,72 +1,251 @@
-"""Provides a dataclass for fixtures along with methods for fetching them and parsing them into objects."""
-from typing import List
-import jsonpickle
-import requests
-import bs4
+"""
+Compact fixture model and the fixtures behind the bot: parsing the onefootball fixtures page into fixtures, reconciling
+scraped fixtures with the stored ones, and the fixture store with its date index and journaled, coalesced predictions.
+"""
+import logging
+import os
+import sqlite3
+import sys
+import threading
+from collections import defaultdict
+from collections.abc import MutableMapping, Mapping
+from typing import List, Set, NamedTuple, Dict, Optional, Iterator, Iterable, Tuple
+import pytz
 from json import JSONDecodeError
-from datetime import datetime, timedelta
-import json_readers
+from datetime import date, datetime, timedelta
+import leagues
+import metrics
+import state_persistence
+from fixture_store import FixtureStore, FixtureRecord, LEGACY_FIXTURES_FILE, fixture_key
+
+
+TIMEZONE = pytz.timezone('Europe/Athens')  # Timezone of the group, in which fixture datetimes are stored and bucketed
+EMPTY_PREDICTION = " "  # Placeholder of a player without a prediction in a fixture's prediction string
+POSTPONED = datetime(1, 1, 1)  # Match datetime of a postponed fixture until it is rescheduled
+RESCHEDULE_WINDOW = timedelta(days=120)  # Furthest an unplayed fixture is moved to a new date without a postponement
+MATCH_DURATION = timedelta(hours=2, minutes=15)  # Kickoff to final whistle, including half time and stoppage
+
+MATCH_CARD_CLASS = "simple-match-cards-list__match-card"
+TEAM_NAME_CLASS = "simple-match-card-team__name"
+TEAM_SCORE_CLASS = "simple-match-card-team__score"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+PREDICTIONS_JOURNAL_FILE = 'predictions.journal'
+PREDICTION_FLUSH_DELAY = 0.5  # Seconds a burst of bets is collected before it is written to the store in one go
+
+FIXTURE_STORE_SECONDS = metrics.histogram("fixture_store_seconds",
+                                          "Time spent reading and writing fixtures and predictions, by operation.")
+
+_store: Optional[FixtureStore] = None
+_index: Optional["FixtureIndex"] = None
+_index_lock = threading.RLock()
+_journal = state_persistence.Journal(PREDICTIONS_JOURNAL_FILE)
+_journal_lock = threading.Lock()  # Keeps journal appends and truncation after a complete flush apart
+_prediction_flusher: "state_persistence.CoalescingFlusher[Tuple[str, str, str]]" = state_persistence.CoalescingFlusher(
+    lambda predictions: _write_predictions(predictions),  # Looked up on flush, as the writer is defined further down
+    PREDICTION_FLUSH_DELAY, name="prediction-flusher")
+
+
+class PlayerSlots:
+    """
+    Shared positions of the players in the fixtures' prediction strings, so that names are stored only once.
+    Slots are assigned under a lock, as bets on the event loop and store work in executor threads add players at once.
+    """
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.index: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+    def sync(self) -> None:
+        """Assigns a slot to every player of every league that does not have one yet."""
+        with self._lock:
+            for league in leagues.directory:
+                for key in league.player_keys():
+                    self.add(key)
+
+    def add(self, name: str) -> int:
+        """Returns the slot of the passed player, assigning a new one if needed."""
+        slot = self.index.get(name)
+        if slot is None:
+            with self._lock:
+                slot = self.index.get(name)
+                if slot is None:
+                    self.names.append(name)
+                    slot = self.index[sys.intern(name)] = len(self.names) - 1
+        return slot
+
+    def get(self, name: str) -> Optional[int]:
+        """Returns the slot of the passed player if it is registered, else None."""
+        slot = self.index.get(name)
+        if slot is None and name is not None:
+            self.sync()
+            slot = self.index.get(name)
+        return slot
+
+
+player_slots = PlayerSlots()
+
+
+class Predictions(MutableMapping):
+    """Dict-like view of the predictions of a fixture, keyed by player name."""
+    __slots__ = ("_fixture",)
+
+    def __init__(self, fixture: "Fixture"):
+        self._fixture = fixture
+
+    def __getitem__(self, name: str) -> str:
+        slot = player_slots.get(name)
+        if slot is None:
+            raise KeyError(name)
+        predictions = self._fixture._predictions
+        prediction = predictions[slot] if slot < len(predictions) else EMPTY_PREDICTION
+        return "" if prediction == EMPTY_PREDICTION else prediction
+
+    def __setitem__(self, name: str, prediction: str) -> None:
+        if len(prediction) > 1:
+            raise ValueError(f"Prediction must be '1', 'X', '2' or empty, not '{prediction}'")
+        slot = player_slots.add(name)
+        predictions = self._fixture._predictions.ljust(slot + 1, EMPTY_PREDICTION)
+        self._fixture._predictions = predictions[:slot] + (prediction or EMPTY_PREDICTION) + predictions[slot + 1:]
+
+    def __delitem__(self, name: str) -> None:
+        self[name] = ""
+
+    def __iter__(self) -> Iterator[str]:
+        player_slots.sync()
+        return iter(list(player_slots.names))
+
+    def __len__(self) -> int:
+        player_slots.sync()
+        return len(player_slots.names)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
 
 
 class Fixture:
-    """Simple data class created from parsing the fetched string from the web."""
-    def __init__(self, fixture_string: str):
+    """
+    Compact data class created from parsing the fetched string from the web.
+
+    Team names are interned and predictions are kept in a single string with one character per player slot, so that
+    holding seasons of fixtures does not duplicate team or player names in every object.
+    """
+    __slots__ = ("home_team", "away_team", "match_datetime", "result", "_predictions")
+
+    def __init__(self, fixture_string: str = ""):
         self.home_team: str = ""
         self.away_team: str = ""
         self.match_datetime: datetime = None
-        self.predictions_dict = {x:"" for x in json_readers.get_player_data_and_player_tables()[0]}
+        self._predictions: str = ""
         self.result = ""
-        self.id: str = ""
-        self.parse_fixture_string(fixture_string)
+        if fixture_string:
+            self.parse_fixture_string(fixture_string)
+
+    @property
+    def predictions_dict(self) -> Predictions:
+        """Predictions of the fixture keyed by player name, with "" for players that have not bet."""
+        return Predictions(self)
+
+    @predictions_dict.setter
+    def predictions_dict(self, predictions: Mapping[str, str]) -> None:
+        self._predictions = ""
+        view = Predictions(self)
+        for name, prediction in predictions.items():
+            view[name] = prediction
+
+    @property
+    def key(self) -> str:
+        """Identity of the fixture in the store, the index and the history: its teams and its date with the year."""
+        return fixture_key(self.home_team, self.away_team, self.match_datetime)
+
+    @property
+    def id(self) -> str:
+        """Short token of the fixture on the bet buttons. It repeats across seasons, so it only identifies a fixture
+        among the fixtures of one day."""
+        return self.make_id()
+
+    @property
+    def prediction_slots(self) -> str:
+        """The raw predictions, one character per player slot of player_slots, EMPTY_PREDICTION where none was made."""
+        return self._predictions
+
+    @classmethod
+    def from_record(cls, record: FixtureRecord) -> "Fixture":
+        """Creates a fixture from its storage representation."""
+        fixture = cls()
+        fixture.home_team = sys.intern(record.home_team)
+        fixture.away_team = sys.intern(record.away_team)
+        fixture.match_datetime = record.match_datetime
+        fixture.result = record.result
+        if record.predictions:
+            fixture.predictions_dict = record.predictions
+        return fixture
+
+    def to_record(self) -> FixtureRecord:
+        """Returns the storage representation of the fixture."""
+        predictions = {name: prediction for name, prediction in zip(player_slots.names, self._predictions)
+                       if prediction != EMPTY_PREDICTION}
+        return FixtureRecord(self.key, self.home_team, self.away_team, self.match_datetime, self.result, predictions)
 
     def __eq__(self, other) -> bool:
-        if type(other) == Fixture.__class__:
+        if not isinstance(other, Fixture):
             return False
-        if self.id == other.id:
+        if self.key == other.key:
             return True
         else:
             return False
 
     def parse_fixture_string(self, string) -> None:
-        """Parse the string and assign values to the class' fields according to the passed tokens."""
-        tokens = string.split("  ")
-        tokens = [x.strip() for x in tokens]
-        for index, token in enumerate(tokens):
-            if index == 0:  # First token is always home team
-                self.home_team = token
-            elif index == 1 and token.isnumeric():  # Second token can be either home team goals
-                self.result = f"{token}:{tokens[3]}"  # in this case 4th token is away team goals
-                self.away_team = tokens[2]  # and 3rd token is away team
-            elif index == 1 and not token.isnumeric():  # or away team
-                self.away_team = token
-            elif index == 2 and ":" in token:  # 3rd token is XX:XX and match is today
-                now = datetime.today()
-                self.match_datetime = now.strftime("%d/%m/%Y") + token.strip()  # to str
-                self.match_datetime = datetime.strptime(self.match_datetime, "%d/%m/%Y%H:%M")
-            elif index == 2 and "Postponed" in token:  # Match is postponed
-                self.match_datetime = datetime(1, 1, 1)
-            elif index == 2 and "/" in token:  # Token is a datetime
-                self.match_datetime = datetime.strptime(token.strip() + " " + tokens[3].strip(), "%d/%m/%Y %H:%M")
-            elif index == 2 and "Tomorrow" in token:  # Token says "Tomorrow" instead of a datetime
-                now = datetime.today() + timedelta(days=1)
-                self.match_datetime = now.strftime("%d/%m/%Y") + tokens[3].strip()  # to str
-                self.match_datetime = datetime.strptime(self.match_datetime, "%d/%m/%Y%H:%M")
-            elif index == 4 and ("'" in token or "Half time" in token or "Today" in token):  # Match is live
-                now = datetime.today()
-                self.match_datetime = now.strftime("%d/%m/%Y")
-                self.match_datetime = datetime.strptime(self.match_datetime, "%d/%m/%Y")
-            elif index == 4 and "/" in token:  # Token is a datetime
-                self.match_datetime = datetime.strptime(token, "%d/%m/%Y")
-            elif index == 4 and "Yesterday" in token:  # Match finished yesterday
-                now = datetime.today() + timedelta(days=1)
-                self.match_datetime = now.strftime("%d/%m/%Y")
-                self.match_datetime = datetime.strptime(self.match_datetime, "%d/%m/%Y")
-        self.id = self.home_team[:2] + self.away_team[:2] + str(self.match_datetime.day) + str(self.match_datetime.month)
-
-    def get_bet_string(self, user_id: int) -> str:
-        """Visual representation of the bet of a user for messaging purposes."""
-        user_name = json_readers.get_player_name_by_id(user_id)
-        return f"{self.home_team} vs {self.away_team} {self.predictions_dict[user_name]} for {user_name}"
+        """
+        Parse the string and assign values to the class' fields according to the passed tokens.
+        Datetimes are built directly from the date and time tokens, and the current date is only looked up for the
+        relative ones.
+        """
+        tokens = [x.strip() for x in string.split("  ")]
+        count = len(tokens)
+        self.home_team = sys.intern(tokens[0])  # First token is always home team
+        if count > 1:
+            if tokens[1].isnumeric():  # Second token can be either home team goals
+                self.result = f"{tokens[1]}:{tokens[3]}"  # in this case 4th token is away team goals
+                self.away_team = sys.intern(tokens[2])  # and 3rd token is away team
+            else:  # or away team
+                self.away_team = sys.intern(tokens[1])
+        if count > 2:
+            token = tokens[2]
+            if ":" in token:  # 3rd token is XX:XX and match is today
+                self.match_datetime = _combine(now().date(), token)
+            elif "Postponed" in token:  # Match is postponed
+                self.match_datetime = POSTPONED
+            elif "/" in token:  # Token is a datetime
+                self.match_datetime = _combine(_parse_date(token), tokens[3])
+            elif "Tomorrow" in token:  # Token says "Tomorrow" instead of a datetime
+                self.match_datetime = _combine(now().date() + timedelta(days=1), tokens[3])
+        if count > 4:
+            token = tokens[4]
+            if "'" in token or "Half time" in token or "Today" in token:  # Match is live
+                today = now().date()
+                self.match_datetime = datetime(today.year, today.month, today.day)
+            elif "/" in token:  # Token is a datetime
+                day = _parse_date(token)
+                self.match_datetime = datetime(day.year, day.month, day.day)
+            elif "Yesterday" in token:  # Match finished yesterday
+                day = now().date() - timedelta(days=1)
+                self.match_datetime = datetime(day.year, day.month, day.day)
+
+    @classmethod
+    def from_fields(cls, home_team: str, away_team: str, match_datetime: datetime, result: str = "") -> "Fixture":
+        """Creates a fixture from already extracted fields."""
+        fixture = cls()
+        fixture.home_team = sys.intern(home_team)
+        fixture.away_team = sys.intern(away_team)
+        fixture.match_datetime = match_datetime
+        fixture.result = result
+        return fixture
+
+    def make_id(self) -> str:
+        """Id made of the first two letters of both teams and the day and month of the match."""
+        return self.home_team[:2] + self.away_team[:2] + str(self.match_datetime.day) + str(self.match_datetime.month)
 
     def __repr__(self) -> str:
         """Provides string representation of class for stdout purposes."""
@@ -78,8 +257,25 @@ class Fixture:
                + f"Date: {self.match_datetime.strftime('%d.%m.%Y %H:%M')}\nResult: {self.result}\nId: {self.id}"
 
     def __hash__(self) -> int:
-        """Override implementation of hash to make class hashable"""
-        return hash(repr(self))
+        """Hashes the fixture key, the same identity __eq__ compares, so that sets and dicts agree with equality."""
+        return hash(self.key)
+
+
+def _parse_date(token: str) -> date:
+    """Parses a dd/mm/yyyy token."""
+    day, month, year = token.split("/")
+    return date(int(year), int(month), int(day))
+
+
+def _combine(day: date, time_token: str) -> datetime:
+    """Combines a date with a HH:MM token."""
+    hour, minute = time_token.strip().split(":")
+    return datetime(day.year, day.month, day.day, int(hour), int(minute))
+
+
+def now() -> datetime:
+    """Current naive datetime in the configured timezone."""
+    return datetime.now(TIMEZONE).replace(tzinfo=None)
 
 
 def sort_key(fixture: Fixture):
@@ -87,56 +283,361 @@ def sort_key(fixture: Fixture):
     return fixture.match_datetime
 
 
-def get_fixtures() -> List[Fixture]:
-    """Get fixtures"""
-    response = requests.get(url=f"https://onefootball.com/en/competition/premier-league-9/fixtures")
-    soup = bs4.BeautifulSoup(response.content, 'lxml')
-    new_fixtures = soup.findAll("li", class_="simple-match-cards-list__match-card")
-    new_fixtures = [x.text.strip() for x in new_fixtures]
-    new_fixtures = [Fixture(x) for x in new_fixtures]
-    old_fixtures = load_fixtures()
-    old_fixtures = sync_old_and_new_fixtures(old_fixtures, new_fixtures)
-    for old_fix in old_fixtures:
-        if old_fix in new_fixtures:
-            new_fixtures.remove(old_fix)
-    fixtures = list(set(new_fixtures + old_fixtures))
-    fixtures.sort(key=sort_key)
-    return fixtures
+def _has_class(element, class_name: str) -> bool:
+    return class_name in (element.get("class") or "").split()
+
+
+def _element_text(element) -> str:
+    return "".join(element.itertext()).strip()
+
+
+def _parse_card_datetime(card) -> Optional[datetime]:
+    """Reads the kickoff from the card's <time datetime="..."> element, converted to the configured timezone."""
+    if any("Postponed" in text for text in card.itertext()):
+        return POSTPONED
+    time_element = next(card.iter("time"), None)
+    if time_element is None or not time_element.get("datetime"):
+        return None
+    match_datetime = datetime.fromisoformat(time_element.get("datetime").replace("Z", "+00:00"))
+    if match_datetime.tzinfo is not None:
+        match_datetime = match_datetime.astimezone(TIMEZONE).replace(tzinfo=None)
+    return match_datetime
+
+
+def fixture_from_card(card) -> Optional[Fixture]:
+    """
+    Builds a fixture from a match card element by reading team names, scores and kickoff from their own elements.
+    Cards without those elements fall back to parsing their text, with text nodes separated by double spaces. Cards
+    with no kickoff date at all are skipped.
+    """
+    from lxml import etree
+    elements = list(card.iter(etree.Element))
+    names = [_element_text(x) for x in elements if _has_class(x, TEAM_NAME_CLASS)]
+    scores = [_element_text(x) for x in elements if _has_class(x, TEAM_SCORE_CLASS)]
+    try:
+        match_datetime = _parse_card_datetime(card)
+        if len(names) == 2 and match_datetime is not None:
+            result = f"{scores[0]}:{scores[1]}" if len(scores) == 2 and all(x.isnumeric() for x in scores) else ""
+            return Fixture.from_fields(names[0], names[1], match_datetime, result)
+        fixture = Fixture("  ".join(x.strip() for x in card.itertext() if x.strip()))
+        if fixture.match_datetime is None:  # No date token either, e.g. a kickoff still to be decided
+            raise ValueError("Match card without a date")
+        return fixture
+    except (ValueError, IndexError, AttributeError):
+        logging.warning(f"Skipping unparseable match card: {etree.tostring(card, method='text', encoding=str)}")
+        return None
+
+
+def iter_fixtures(chunks: Iterable[bytes]) -> Iterator[Fixture]:
+    """
+    Streams the fixtures page through lxml's incremental HTML parser and yields a fixture for every match card as
+    soon as the card is complete. Processed cards are discarded so that the full DOM is never held in memory.
+    """
+    from lxml import etree  # Imported on first parse rather than at startup
+    parser = etree.HTMLPullParser(events=("end",), tag="li")
+
+    def drain() -> Iterator[Fixture]:
+        for _, element in parser.read_events():
+            if not _has_class(element, MATCH_CARD_CLASS):
+                continue
+            fixture = fixture_from_card(element)
+            element.clear()
+            parent = element.getparent()
+            while parent is not None and element.getprevious() is not None:
+                del parent[0]
+            if fixture is not None:
+                yield fixture
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from drain()
+    parser.close()
+    yield from drain()
+
+
+def _iter_chunks(content: bytes) -> Iterator[bytes]:
+    view = memoryview(content)
+    for start in range(0, len(view), STREAM_CHUNK_SIZE):
+        yield bytes(view[start:start + STREAM_CHUNK_SIZE])
+
+
+def parse_fixtures_page(content: bytes) -> List[Fixture]:
+    """Parses the onefootball fixtures page into Fixture objects."""
+    return list(iter_fixtures(_iter_chunks(content)))
+
+
+def has_kickoff_time(match_datetime: datetime) -> bool:
+    """False for the date-only datetimes parsed from live and finished matches, which carry no kickoff time."""
+    return match_datetime.hour != 0 or match_datetime.minute != 0
+
+
+def is_settled(fixture: Fixture, current: datetime = None) -> bool:
+    """
+    True if the fixture has a result that can no longer change: its match is over, or, for fixtures without a kickoff
+    time, it was played before today.
+    """
+    if not fixture.result:
+        return False
+    current = current if current is not None else now()
+    if has_kickoff_time(fixture.match_datetime):
+        return fixture.match_datetime + MATCH_DURATION <= current
+    return fixture.match_datetime.date() < current.date()
+
+
+class Reconciliation(NamedTuple):
+    """Outcome of merging scraped fixtures into stored ones."""
+    fixtures: List[Fixture]  # Every stored and scraped fixture once, sorted by datetime
+    inserted: List[Fixture]  # Scraped fixtures that were not stored
+    updated: List[Fixture]  # Stored fixtures whose result or kickoff time changed, including moved ones
+    unchanged: List[Fixture]  # Stored fixtures that were scraped again without changes
+    moved: Dict[str, Fixture]  # Previous key of every stored fixture that was postponed or rescheduled to another date
+
+
+def _take_rescheduled(candidates: Optional[List[Fixture]], match_datetime: datetime) -> Optional[Fixture]:
+    """
+    Removes and returns the candidate closest in date to the passed datetime that can have been moved there: any if
+    either date is the postponement placeholder, else one within RESCHEDULE_WINDOW.
+    """
+    if not candidates:
+        return None
+
+    def distance(fixture: Fixture) -> timedelta:
+        if POSTPONED in (fixture.match_datetime, match_datetime):
+            return timedelta(0)
+        return abs(fixture.match_datetime - match_datetime)
+
+    closest = min(candidates, key=distance)
+    if distance(closest) > RESCHEDULE_WINDOW:
+        return None
+    candidates.remove(closest)
+    return closest
+
+
+def reconcile_fixtures(stored_fixtures: List[Fixture], scraped_fixtures: List[Fixture]) -> Reconciliation:
+    """
+    Merges scraped fixtures into stored ones in linear time using a dict keyed on the fixture key.
+
+    Stored fixtures are updated in place so that their predictions are kept. Date-only datetimes of live and finished
+    matches never overwrite a stored kickoff time. A scraped fixture with no stored key is matched to an unplayed
+    stored fixture of the same teams that is missing from the scraped pages, as postponed and rescheduled matches
+    change date and so key.
+    """
+    merged: Dict[str, Fixture] = {x.key: x for x in stored_fixtures}
+    scraped_keys = {x.key for x in scraped_fixtures}
+    unplayed: Dict[Tuple[str, str], List[Fixture]] = defaultdict(list)
+    for fixture in stored_fixtures:
+        if not fixture.result and fixture.key not in scraped_keys:
+            unplayed[(fixture.home_team, fixture.away_team)].append(fixture)
+    inserted, updated, unchanged, moved = [], [], [], {}
+    for scraped in scraped_fixtures:
+        key = scraped.key
+        stored = merged.get(key)
+        if stored is None:
+            stored = _take_rescheduled(unplayed.get((scraped.home_team, scraped.away_team)), scraped.match_datetime)
+            if stored is None:
+                merged[key] = scraped
+                inserted.append(scraped)
+                continue
+            moved[stored.key] = stored
+            del merged[stored.key]
+            merged[key] = stored
+            stored.match_datetime = scraped.match_datetime
+            stored.result = scraped.result
+            updated.append(stored)
+            continue
+        match_datetime = scraped.match_datetime if has_kickoff_time(scraped.match_datetime) else stored.match_datetime
+        if scraped.result != stored.result or match_datetime != stored.match_datetime:
+            stored.result = scraped.result
+            stored.match_datetime = match_datetime
+            updated.append(stored)
+        else:
+            unchanged.append(stored)
+    return Reconciliation(sorted(merged.values(), key=sort_key), inserted, updated, unchanged, moved)
+
+
+@metrics.timed(FIXTURE_STORE_SECONDS, operation="apply_scraped_fixtures")
+def apply_scraped_fixtures(new_fixtures: List[Fixture]) -> Reconciliation:
+    """
+    Writes only new fixtures and changed results and kickoff times of stored fixtures to the store, leaving the
+    predictions untouched apart from moving those of fixtures that changed key, and rebuilds the fixture index from
+    the merged fixtures.
+    """
+    with _index_lock:
+        flush_predictions()
+        reconciliation = reconcile_fixtures(load_fixtures(), new_fixtures)
+        changed = [x.to_record() for x in reconciliation.inserted] \
+            + [x.to_record()._replace(predictions={}) for x in reconciliation.updated]
+        if changed:
+            get_store().upsert_fixtures(changed, [(key, x.key) for key, x in reconciliation.moved.items()])
+            _set_index(FixtureIndex(reconciliation.fixtures, _index, reconciliation.inserted + reconciliation.updated,
+                                    reconciliation.moved))
+    return reconciliation
 
 
 def sync_old_and_new_fixtures(old_fixtures: List[Fixture], new_fixtures: List[Fixture]):
-    """Compares two lists and updates the 'result' field of the old_fixtures with the updated values of new_fixtures."""
-    fixtures_that_can_be_updated = []
-    for old_fix in old_fixtures:
-        if old_fix in new_fixtures:
-            fixtures_that_can_be_updated.append(old_fix)
-    for fixture in fixtures_that_can_be_updated:
-        fixture.result = new_fixtures[new_fixtures.index(fixture)].result
-    for fixture in fixtures_that_can_be_updated:
-        if fixture in old_fixtures:
-            old_fixtures.remove(fixture)
-            old_fixtures.append(fixture)
+    """Updates the 'result' field of the old_fixtures in place with the updated values of new_fixtures."""
+    reconcile_fixtures(old_fixtures, new_fixtures)
     return old_fixtures
 
 
+@metrics.timed(FIXTURE_STORE_SECONDS, operation="write_predictions")
+def _write_predictions(predictions: List[Tuple[str, str, str]]) -> None:
+    get_store().set_predictions(predictions)
+    with _journal_lock:
+        if not _prediction_flusher.pending():
+            _journal.truncate()
+
+
+def get_store() -> FixtureStore:
+    """
+    Returns the fixture store, migrating the legacy fixtures.json into it the first time it is opened empty and
+    replaying predictions journaled before a crash.
+    """
+    global _store
+    if _store is None:
+        store = FixtureStore()
+        if store.is_empty() and os.path.exists(LEGACY_FIXTURES_FILE):
+            try:
+                store.migrate_from_json(LEGACY_FIXTURES_FILE)
+            except (IOError, JSONDecodeError, ValueError, KeyError, TypeError, AttributeError, sqlite3.Error):
+                logging.exception(f"Failed to migrate {LEGACY_FIXTURES_FILE}, starting with an empty fixture store.")
+        recover_predictions(store)
+        _store = store  # Published only once migrated and replayed, so no caller skips the replay
+    return _store
+
+
+def recover_predictions(store: FixtureStore) -> int:
+    """Replays the predictions journal into the store and empties it. Returns the number of replayed predictions."""
+    predictions = [(x["fixture"], x["player"], x["prediction"]) for x in _journal.replay()]
+    if predictions:
+        store.set_predictions(predictions)
+        logging.info(f"Recovered {len(predictions)} journaled predictions.")
+    _journal.truncate()
+    return len(predictions)
+
+
+def flush_predictions() -> None:
+    """Writes predictions that are still waiting for their coalesced flush to the store."""
+    _prediction_flusher.flush_now()
+
+
+class FixtureIndex:
+    """
+    Fixtures bucketed by calendar date in the configured timezone, built once per fixture load.
+
+    Day versions change whenever a day's fixtures change and prediction versions whenever a player's prediction on a
+    day changes, so that anything rendered from a day can be cached until its versions move.
+    """
+
+    def __init__(self, fixtures_list: List[Fixture], previous: "FixtureIndex" = None,
+                 changed: Iterable[Fixture] = (), previous_keys: Iterable[str] = ()):
+        by_date: Dict[date, List[Fixture]] = defaultdict(list)
+        for fixture in sorted(fixtures_list, key=sort_key):
+            by_date[fixture.match_datetime.date()].append(fixture)
+        self.by_date: Dict[date, List[Fixture]] = dict(by_date)
+        self.by_key: Dict[str, Fixture] = {x.key: x for x in fixtures_list}
+        self.ids: Set[str] = {x.id for x in fixtures_list}  # Button tokens
+        self.team_names: Set[str] = {x.home_team for x in fixtures_list} | {x.away_team for x in fixtures_list}
+        self.day_versions: Dict[date, int] = dict(previous.day_versions) if previous is not None else {}
+        self.prediction_versions: Dict[Tuple[date, str], int] = \
+            dict(previous.prediction_versions) if previous is not None else {}
+        for fixture in changed:
+            self._bump_day(fixture.match_datetime.date())
+            old_fixture = previous.by_key.get(fixture.key) if previous is not None else None
+            if old_fixture is not None:
+                self._bump_day(old_fixture.match_datetime.date())
+        for key in previous_keys:  # Keys fixtures had before they were moved to another date
+            old_fixture = previous.by_key.get(key) if previous is not None else None
+            if old_fixture is not None:
+                self._bump_day(old_fixture.match_datetime.date())
+
+    def _bump_day(self, day: date) -> None:
+        self.day_versions[day] = self.day_versions.get(day, 0) + 1
+
+    def fixtures_of_day(self, day: date) -> List[Fixture]:
+        """The fixtures of the passed date, sorted by their datetime."""
+        return self.by_date.get(day, [])
+
+    def versions(self, day: date, player_name: str) -> Tuple[int, int]:
+        """Versions of the day's fixtures and of the player's predictions on that day."""
+        return self.day_versions.get(day, 0), self.prediction_versions.get((day, player_name), 0)
+
+    def prediction_changed(self, fixture: Fixture, player_name: str) -> None:
+        key = (fixture.match_datetime.date(), player_name)
+        self.prediction_versions[key] = self.prediction_versions.get(key, 0) + 1
+
+
+def _set_index(index: Optional[FixtureIndex]) -> None:
+    global _index
+    _index = index
+
+
+def get_index() -> FixtureIndex:
+    """Returns the fixture index, loading it from the store on first use."""
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _set_index(FixtureIndex(load_fixtures()))
+    return _index
+
+
+@metrics.timed(FIXTURE_STORE_SECONDS, operation="write_fixtures")
 def write_fixtures(fixtures) -> bool:
-    """Tries to write fixtures to fixtures.json"""
+    """Tries to write fixtures to the fixture store"""
     try:
-        with open("fixtures.json", "w+", encoding="utf8") as file:
-            jsonpickle.set_preferred_backend('json')
-            jsonpickle.set_encoder_options('json', ensure_ascii=False, sort_keys=True, indent=4)
-            file.write(jsonpickle.dumps(fixtures))
-    except (IOError, FileNotFoundError, JSONDecodeError):
+        with _index_lock:
+            flush_predictions()
+            get_store().upsert_fixtures([x.to_record() for x in fixtures])
+            if _index is not None:
+                _set_index(FixtureIndex(load_fixtures(), _index, fixtures))
+        return True
+    except sqlite3.Error:
         return False
 
 
+@metrics.timed(FIXTURE_STORE_SECONDS, operation="set_prediction")
+def set_prediction(fixture: Fixture, player_name: str, prediction: str) -> bool:
+    """
+    Stores a single player's prediction on the passed fixture. The prediction is durably journaled and applied to the
+    index right away, while the store is updated by a coalesced flush so that a burst of bets produces one write.
+    """
+    with _journal_lock:
+        try:
+            _journal.append({"fixture": fixture.key, "player": player_name, "prediction": prediction})
+        except IOError:
+            logging.exception("Failed to journal a prediction.")
+            return False
+        _prediction_flusher.submit((fixture.key, player_name, prediction))
+    with _index_lock:
+        index = get_index()
+        indexed_fixture = index.by_key.get(fixture.key, fixture)
+        indexed_fixture.predictions_dict[player_name] = prediction
+        if indexed_fixture is not fixture:
+            fixture.predictions_dict[player_name] = prediction
+        index.prediction_changed(indexed_fixture, player_name)
+    return True
+
+
+@metrics.timed(FIXTURE_STORE_SECONDS, operation="load_fixtures")
 def load_fixtures() -> List[Fixture]:
-    """Tries to load fixtures from fixtures.json"""
+    """Tries to load fixtures from the fixture store"""
     try:
-        with open("fixtures.json", "r+", encoding="utf8") as file:
-            jsonpickle.set_preferred_backend('json')
-            jsonpickle.set_decoder_options('json')
-            old_fixtures = jsonpickle.loads(file.read())
-            return old_fixtures if old_fixtures is not None else []
-    except (IOError, FileNotFoundError, JSONDecodeError):
+        return [Fixture.from_record(x) for x in get_store().load_fixtures()]
+    except sqlite3.Error:
+        logging.exception("Failed to load fixtures from the fixture store.")
         return []
+
+
+def fixtures_of_day(filter_datetime: datetime) -> List[Fixture]:
+    """Returns the indexed fixtures on the same day as the passed datetime, sorted by their datetime."""
+    return get_index().fixtures_of_day(filter_datetime.date())
+
+
+def get_team_names() -> Set[str]:
+    """Returns the names of all teams that appear in stored fixtures."""
+    return get_index().team_names
+
+
+def fixture_exists(fixture_id: str) -> bool:
+    """True if a fixture with the passed button token is stored."""
+    return fixture_id in get_index().ids
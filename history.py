@@ -0,0 +1,311 @@
+"""
+Columnar, append-only archive of every score computation and every settled prediction, with analytical queries.
+
+Every table is a directory holding one raw binary file per column, appended to on writes and memory-mapped as NumPy
+arrays on reads, so queries over several seasons scan contiguous integer columns without parsing anything. Player,
+team, league and fixture names are dictionary-encoded into integer codes kept in 'dictionary.json'.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import fixtures
+import leagues
+import settlement
+import state_persistence
+
+HISTORY_DIRECTORY = 'history'
+DICTIONARY_FILE = 'dictionary.json'
+PICKS = settlement.PICKS  # Predictions and match outcomes are encoded as their index in PICKS
+EPOCH = datetime(1970, 1, 1)
+
+SCORE_COLUMNS = {"timestamp": np.int64, "league": np.int32, "player": np.int32, "score": np.int32}
+PREDICTION_COLUMNS = {"kickoff": np.int64, "league": np.int32, "fixture": np.int32, "home": np.int32,
+                      "away": np.int32, "player": np.int32, "pick": np.int8, "outcome": np.int8}
+
+
+def to_seconds(value: datetime) -> int:
+    """Seconds of a naive datetime in the configured timezone since the epoch, as stored in the archive."""
+    return int((value - EPOCH).total_seconds())
+
+
+def from_seconds(value: int) -> datetime:
+    return EPOCH + timedelta(seconds=int(value))
+
+
+def encode_pick(prediction: str) -> int:
+    """Index of a '1', 'X' or '2' prediction in PICKS, or -1."""
+    return PICKS.index(prediction) if prediction in PICKS else -1
+
+
+class ColumnTable:
+    """
+    Append-only table stored as one raw binary file per column. The row count is that of the shortest column, so a
+    write torn by a crash is ignored on reads and cut off before the next append.
+    """
+
+    def __init__(self, directory: str, columns: Dict[str, type]):
+        self.directory: str = directory
+        self.columns: Dict[str, np.dtype] = {name: np.dtype(dtype) for name, dtype in columns.items()}
+        self._cache: Optional[Tuple[int, Dict[str, np.ndarray]]] = None
+
+    def _path(self, column: str) -> str:
+        return os.path.join(self.directory, f"{column}.bin")
+
+    def __len__(self) -> int:
+        rows = []
+        for column, dtype in self.columns.items():
+            try:
+                rows.append(os.path.getsize(self._path(column)) // dtype.itemsize)
+            except FileNotFoundError:
+                return 0
+        return min(rows)
+
+    def append(self, **arrays) -> None:
+        """Appends rows given as one equally long sequence per column."""
+        os.makedirs(self.directory, exist_ok=True)
+        with state_persistence.file_lock(os.path.join(self.directory, "table")):
+            rows = len(self)
+            for column, dtype in self.columns.items():
+                data = np.ascontiguousarray(arrays[column], dtype=dtype)
+                with open(self._path(column), "ab") as file:
+                    file.truncate(rows * dtype.itemsize)
+                    file.write(data.tobytes())
+                    file.flush()
+                    os.fsync(file.fileno())
+
+    def read(self) -> Dict[str, np.ndarray]:
+        """Memory-maps every column, read-only. The maps are reused until rows are appended."""
+        rows = len(self)
+        if self._cache is not None and self._cache[0] == rows:
+            return self._cache[1]
+        if rows == 0:
+            columns = {column: np.zeros(0, dtype=dtype) for column, dtype in self.columns.items()}
+        else:
+            columns = {column: np.memmap(self._path(column), dtype=dtype, mode="r", shape=(rows,))
+                       for column, dtype in self.columns.items()}
+        self._cache = (rows, columns)
+        return columns
+
+
+class Vocabulary:
+    """Integer codes of the strings of one kind, e.g. player keys, in order of first appearance."""
+
+    def __init__(self, values: List[str] = ()):
+        self.values: List[str] = list(values)
+        self.codes: Dict[str, int] = {value: code for code, value in enumerate(self.values)}
+
+    def encode(self, value: str) -> int:
+        """Returns the code of value, assigning the next one if it has none."""
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class ScoreChange(NamedTuple):
+    """A player's table-position score at the end of a date range and its change over the range."""
+    player: str
+    score: int
+    change: int
+
+
+class Accuracy(NamedTuple):
+    """Settled predictions of a player and how many were right, in total and per pick."""
+    player: str
+    predictions: int
+    hits: int
+    pick_predictions: Tuple[int, int, int]
+    pick_hits: Tuple[int, int, int]
+
+
+class TeamAccuracy(NamedTuple):
+    team: str
+    predictions: int
+    hits: int
+
+
+class HeadToHead(NamedTuple):
+    """Settled fixtures both players predicted, by who got them right."""
+    fixtures: int
+    both: int
+    first_only: int
+    second_only: int
+    neither: int
+
+
+class HistoryArchive:
+    """Score snapshots and settled predictions of all leagues in columnar tables under `directory`."""
+
+    def __init__(self, directory: str = HISTORY_DIRECTORY):
+        self.directory: str = directory
+        self.scores = ColumnTable(os.path.join(directory, "scores"), SCORE_COLUMNS)
+        self.predictions = ColumnTable(os.path.join(directory, "predictions"), PREDICTION_COLUMNS)
+        self._vocabularies: Optional[Dict[str, Vocabulary]] = None
+        self._lock = threading.RLock()
+
+    @property
+    def vocabularies(self) -> Dict[str, Vocabulary]:
+        """Vocabularies of player keys, teams, league namespaces and archived fixture keys, loaded on first use."""
+        if self._vocabularies is None:
+            try:
+                with open(os.path.join(self.directory, DICTIONARY_FILE), encoding="utf8") as file:
+                    values = json.load(file)
+            except (IOError, FileNotFoundError, json.decoder.JSONDecodeError):
+                values = {}
+            self._vocabularies = {kind: Vocabulary(values.get(kind, []))
+                                  for kind in ("players", "teams", "leagues", "fixtures")}
+        return self._vocabularies
+
+    def _save_vocabularies(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        state_persistence.atomic_write_json(os.path.join(self.directory, DICTIONARY_FILE),
+                                            {kind: x.values for kind, x in self.vocabularies.items()},
+                                            ensure_ascii=False)
+
+    def _code(self, kind: str, value: str) -> Optional[int]:
+        return self.vocabularies[kind].codes.get(value)
+
+    def append_scores(self, namespace: str, player_keys: List[str], scores, timestamp: datetime) -> None:
+        """Appends a snapshot of the scores of a league's players."""
+        if not player_keys:
+            return
+        with self._lock:
+            vocabularies = self.vocabularies
+            league = vocabularies["leagues"].encode(namespace)
+            players = [vocabularies["players"].encode(x) for x in player_keys]
+            self._save_vocabularies()
+            self.scores.append(timestamp=np.full(len(players), to_seconds(timestamp)),
+                               league=np.full(len(players), league), player=players, score=scores)
+
+    def archive_settled(self, fixtures_list: List["fixtures.Fixture"], current: datetime = None) -> int:
+        """Appends the predictions of every settled fixture that is not archived yet. Returns the number of fixtures."""
+        with self._lock:
+            vocabularies = self.vocabularies
+            settled = [x for x in fixtures_list
+                       if x.key not in vocabularies["fixtures"].codes and fixtures.is_settled(x, current)
+                       and settlement.encode_outcome(x.result) >= 0]
+            if not settled:
+                return 0
+            rows: Dict[str, list] = {column: [] for column in PREDICTION_COLUMNS}
+            for fixture in settled:
+                code = vocabularies["fixtures"].encode(fixture.key)
+                outcome = settlement.encode_outcome(fixture.result)
+                for player_key, prediction in fixture.to_record().predictions.items():
+                    pick = encode_pick(prediction)
+                    if pick < 0:
+                        continue
+                    rows["kickoff"].append(to_seconds(fixture.match_datetime))
+                    rows["league"].append(vocabularies["leagues"].encode(leagues.split_player_key(player_key)[0]))
+                    rows["fixture"].append(code)
+                    rows["home"].append(vocabularies["teams"].encode(fixture.home_team))
+                    rows["away"].append(vocabularies["teams"].encode(fixture.away_team))
+                    rows["player"].append(vocabularies["players"].encode(player_key))
+                    rows["pick"].append(pick)
+                    rows["outcome"].append(outcome)
+            # The dictionary is written first, so that no archived row refers to an unknown code
+            self._save_vocabularies()
+            if rows["player"]:
+                self.predictions.append(**rows)
+            return len(settled)
+
+    def _prediction_rows(self, namespace: Optional[str], start: datetime = None,
+                         end: datetime = None) -> Dict[str, np.ndarray]:
+        columns = self.predictions.read()
+        mask = np.ones(len(columns["player"]), dtype=bool)
+        if namespace is not None:
+            mask &= columns["league"] == self._code("leagues", namespace)
+        if start is not None:
+            mask &= columns["kickoff"] >= to_seconds(start)
+        if end is not None:
+            mask &= columns["kickoff"] < to_seconds(end)
+        return {column: values[mask] for column, values in columns.items()}
+
+    def leaderboard(self, namespace: str, start: datetime, end: datetime) -> List[ScoreChange]:
+        """
+        Every player of the league with a score snapshot up to end, with their last score up to end and its change
+        since their last snapshot before start, or since their first snapshot in the range. Lowest, i.e. best, scores
+        first. Snapshots are stored to the second, so one taken in the same second as end is included.
+        """
+        columns = self.scores.read()
+        mask = (columns["league"] == self._code("leagues", namespace)) & (columns["timestamp"] <= to_seconds(end))
+        timestamps, players, scores = columns["timestamp"][mask], columns["player"][mask], columns["score"][mask]
+        if not len(players):
+            return []
+        order = np.lexsort((timestamps, players))
+        timestamps, players, scores = timestamps[order], players[order], scores[order]
+        group_starts = np.flatnonzero(np.r_[True, players[1:] != players[:-1]])
+        group_ends = np.r_[group_starts[1:], len(players)] - 1
+        before_start = np.add.reduceat((timestamps < to_seconds(start)).astype(np.int64), group_starts)
+        baselines = np.where(before_start > 0, group_starts + before_start - 1, group_starts)
+        changes = scores[group_ends].astype(np.int64) - scores[baselines]
+        names = self.vocabularies["players"].values
+        ranking = np.lexsort((changes, scores[group_ends]))
+        return [ScoreChange(leagues.split_player_key(names[players[group_ends[x]]])[1], int(scores[group_ends[x]]),
+                            int(changes[x])) for x in ranking]
+
+    def score_history(self, player_key: str) -> List[Tuple[datetime, int]]:
+        """A player's table-position score over time."""
+        columns = self.scores.read()
+        mask = columns["player"] == self._code("players", player_key)
+        timestamps, scores = columns["timestamp"][mask], columns["score"][mask]
+        order = np.argsort(timestamps, kind="stable")
+        return [(from_seconds(x), int(y)) for x, y in zip(timestamps[order], scores[order])]
+
+    def accuracy(self, namespace: Optional[str], start: datetime = None, end: datetime = None) -> List[Accuracy]:
+        """1/X/2 hit rates of every player of the league over settled fixtures, most hits first."""
+        rows = self._prediction_rows(namespace, start, end)
+        size = len(self.vocabularies["players"])
+        players, picks = rows["player"], rows["pick"]
+        hits = (picks == rows["outcome"]).astype(np.int64)
+        totals = np.bincount(players, minlength=size)
+        hit_totals = np.bincount(players, weights=hits, minlength=size).astype(np.int64)
+        pick_totals = [np.bincount(players[picks == x], minlength=size) for x in range(len(PICKS))]
+        pick_hits = [np.bincount(players[picks == x], weights=hits[picks == x], minlength=size).astype(np.int64)
+                     for x in range(len(PICKS))]
+        names = self.vocabularies["players"].values
+        result = [Accuracy(leagues.split_player_key(names[x])[1], int(totals[x]), int(hit_totals[x]),
+                           tuple(int(y[x]) for y in pick_totals), tuple(int(y[x]) for y in pick_hits))
+                  for x in np.flatnonzero(totals)]
+        return sorted(result, key=lambda x: (-x.hits, x.predictions))
+
+    def team_accuracy(self, player_key: str) -> List[TeamAccuracy]:
+        """A player's hit rate on the settled fixtures of every team, most accurate first."""
+        rows = self._prediction_rows(None)
+        mask = rows["player"] == self._code("players", player_key)
+        hits = (rows["pick"][mask] == rows["outcome"][mask]).astype(np.int64)
+        teams = np.concatenate([rows["home"][mask], rows["away"][mask]])
+        size = len(self.vocabularies["teams"])
+        totals = np.bincount(teams, minlength=size)
+        hit_totals = np.bincount(teams, weights=np.concatenate([hits, hits]), minlength=size).astype(np.int64)
+        names = self.vocabularies["teams"].values
+        result = [TeamAccuracy(names[x], int(totals[x]), int(hit_totals[x])) for x in np.flatnonzero(totals)]
+        return sorted(result, key=lambda x: (-x.hits / x.predictions, -x.predictions))
+
+    def head_to_head(self, first_key: str, second_key: str) -> HeadToHead:
+        """Compares two players over the settled fixtures both of them predicted."""
+        rows = self._prediction_rows(None)
+        size = len(self.vocabularies["fixtures"])
+        results = []
+        for player_key in (first_key, second_key):
+            mask = rows["player"] == self._code("players", player_key)
+            result = np.full(size, -1, dtype=np.int8)  # -1 unpredicted, 0 wrong, 1 right, indexed by fixture code
+            result[rows["fixture"][mask]] = rows["pick"][mask] == rows["outcome"][mask]
+            results.append(result)
+        first, second = results
+        both_predicted = (first >= 0) & (second >= 0)
+        return HeadToHead(int(both_predicted.sum()), int((both_predicted & (first == 1) & (second == 1)).sum()),
+                          int((both_predicted & (first == 1) & (second == 0)).sum()),
+                          int((both_predicted & (first == 0) & (second == 1)).sum()),
+                          int((both_predicted & (first == 0) & (second == 0)).sum()))
+
+
+archive = HistoryArchive()
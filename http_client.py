@@ -0,0 +1,84 @@
+"""Pooled asynchronous HTTP client shared by every scraper of the bot."""
+import time
+from typing import Optional
+
+import httpx
+
+import metrics
+
+HTTP_TIMEOUT = 15  # Seconds
+HTTP_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10)
+HTTP_HEADERS = {"User-Agent": "Mozilla/5.0 (compatible; premierLeaguePythonBot)"}
+
+FETCH_SECONDS = metrics.histogram("http_fetch_seconds", "Latency of upstream HTTP requests by host.")
+FETCH_FAILURES = metrics.counter("http_fetch_failures", "Upstream HTTP requests that failed, by host and reason.")
+SCRAPE_FAILURES = metrics.counter("scrape_failures", "Scrapes of upstream pages that failed, by source.")
+
+_client: Optional[httpx.AsyncClient] = None
+_transport: Optional[httpx.AsyncBaseTransport] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Returns the shared client, creating it on first use so that it binds to the running event loop."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS, headers=HTTP_HEADERS,
+                                    follow_redirects=True, transport=_transport)
+    return _client
+
+
+def use_transport(transport: Optional[httpx.AsyncBaseTransport]) -> None:
+    """
+    Routes every request of the shared client through the passed transport, e.g. an httpx.MockTransport replaying
+    recorded pages. Passing None restores the network transport. Takes effect on the next client creation.
+    """
+    global _client, _transport
+    _transport = transport
+    _client = None
+
+
+async def _get(url: str, headers: Optional[dict]) -> httpx.Response:
+    """GETs the passed url through the shared connection pool, recording its latency and failures."""
+    host = httpx.URL(url).host
+    start = time.perf_counter()
+    try:
+        response = await get_client().get(url, headers=headers)
+    except httpx.HTTPError as error:
+        FETCH_FAILURES.inc(host=host, reason=type(error).__name__)
+        raise
+    FETCH_SECONDS.observe(time.perf_counter() - start, host=host)
+    if response.is_error:
+        FETCH_FAILURES.inc(host=host, reason=response.status_code)
+    return response
+
+
+async def fetch(url: str, headers: dict = None) -> httpx.Response:
+    """GETs the passed url through the shared connection pool and raises for error status codes."""
+    response = await _get(url, headers)
+    response.raise_for_status()
+    return response
+
+
+async def fetch_if_modified(url: str, etag: str = None, last_modified: str = None) -> Optional[httpx.Response]:
+    """
+    Conditionally GETs the passed url using the validators of a previous response. Returns None if the server
+    answered 304 Not Modified.
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response = await _get(url, headers)
+    if response.status_code == httpx.codes.NOT_MODIFIED:
+        return None
+    response.raise_for_status()
+    return response
+
+
+async def close_client() -> None:
+    """Closes the shared client and its pooled connections."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -1,17 +1,31 @@
 """Utility functions that handle writing and reading to and from json files."""
 import json
-import traceback
-from typing import Tuple, List
+import os
+import threading
+import time
+from typing import Tuple, List, Optional, Dict, TYPE_CHECKING
 
-from player import Player
+import metrics
+import state_persistence
 
+if TYPE_CHECKING:  # Importing player at runtime would load the scoring dependencies at startup
+    from player import Player
 
-def read_json_tables() -> Tuple[dict, dict]:
+PLAYER_TABLES_FILE = 'player_tables.json'
+PLAYER_DATA_FILE = 'player_data.json'
+REGISTRY_CHECK_INTERVAL = 5  # Seconds between checks of the json files' modification times
+
+REGISTRY_RELOAD_SECONDS = metrics.histogram("player_registry_reload_seconds",
+                                            "Time spent re-reading the player json files.")
+
+
+def read_json_tables(player_data_file: str = PLAYER_DATA_FILE,
+                     player_tables_file: str = PLAYER_TABLES_FILE) -> Tuple[dict, dict]:
     """Attempts to open 'player_tables.json' and 'player_data.json' and returns them as a tuple of dicts."""
-    with open('player_tables.json') as file:
+    with open(player_tables_file) as file:
         player_tables_dict: dict = json.load(file)
 
-    with open('player_data.json') as file:
+    with open(player_data_file) as file:
         player_data_dict: dict = json.load(file)
         if len(player_data_dict.keys()) < len(player_tables_dict.keys()):
             for added_player in [x for x in player_tables_dict.keys() if x not in player_data_dict.keys()]:
@@ -20,43 +34,75 @@ def read_json_tables() -> Tuple[dict, dict]:
     return player_data_dict, player_tables_dict
 
 
-def get_player_data_and_player_tables() -> Tuple[dict, dict]:
-    """Read json files"""
-    try:
-        player_data, player_tables = read_json_tables()
-    except (IOError, FileNotFoundError, json.decoder.JSONDecodeError):
-        print(traceback.format_exc())
-        player_data = player_tables = None
-    return player_data, player_tables
+class PlayerRegistry:
+    """
+    Loaded-once view of 'player_data.json' and 'player_tables.json' with O(1) lookups by user_id and by name.
+
+    The files are re-read only when their modification times change, which is checked at most once every
+    `check_interval` seconds, or when reload() is called explicitly.
+    """
+
+    def __init__(self, player_data_file: str = PLAYER_DATA_FILE, player_tables_file: str = PLAYER_TABLES_FILE,
+                 check_interval: float = REGISTRY_CHECK_INTERVAL):
+        self.player_data_file = player_data_file
+        self.player_tables_file = player_tables_file
+        self.check_interval = check_interval
+        self.player_data: Optional[dict] = None
+        self.player_tables: Optional[dict] = None
+        self._names_by_id: Dict[object, str] = {}
+        self._mtimes: Optional[Tuple[int, int]] = None
+        self._checked_at: float = 0.0
+        self._lock = threading.RLock()
 
+    def _current_mtimes(self) -> Tuple[int, int]:
+        return os.stat(self.player_data_file).st_mtime_ns, os.stat(self.player_tables_file).st_mtime_ns
 
-def get_player_name_by_id(user_id: object) -> str:
-    """Get player_name according to passed telegram user_id from player_data.json"""
-    try:
-        with open('player_data.json') as file:
-            player_tables_dict: dict = json.load(file)
-        for index, player in enumerate(player_tables_dict):
-            if player_tables_dict[player]["user_id"] == user_id:
-                return str(list(player_tables_dict.keys())[index])
-    except (IOError, FileNotFoundError, json.decoder.JSONDecodeError):
-        pass
+    def _ensure_loaded(self) -> None:
+        """Loads the files on first use and reloads them if they changed on disk."""
+        now = time.monotonic()
+        if self.player_data is not None and now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            if self.player_data is None or self._current_mtimes() != self._mtimes:
+                self.reload()
 
+    def reload(self) -> None:
+        """Re-reads both json files and rebuilds the indexes."""
+        with self._lock, REGISTRY_RELOAD_SECONDS.time():
+            mtimes = self._current_mtimes()
+            player_data, player_tables = read_json_tables(self.player_data_file, self.player_tables_file)
+            names_by_id = {}
+            for name, data in player_data.items():
+                names_by_id.setdefault(data.get("user_id"), name)
+            self.player_data, self.player_tables, self._names_by_id = player_data, player_tables, names_by_id
+            self._mtimes = mtimes
+            self._checked_at = time.monotonic()
 
-def update_players_scores(players_list: List[Player]) -> None:
-    """Opens 'player_data.json' and attempts to update the key values with calculated data."""
-    with open('player_data.json', 'w') as outfile:
+    def get_player_data_and_player_tables(self) -> Tuple[dict, dict]:
+        """Returns the cached player data and player tables dicts."""
+        self._ensure_loaded()
+        return self.player_data, self.player_tables
+
+    def get_name_by_id(self, user_id: object) -> Optional[str]:
+        """Returns the name of the player with the passed telegram user_id, if registered."""
+        self._ensure_loaded()
+        return self._names_by_id.get(user_id)
+
+    def update_scores(self, players_list: List["Player"]) -> None:
+        """Atomically writes the players' calculated data to the player data file and updates the cached data."""
         temp_dict = {}
         for player in players_list:
             temp_dict.update(
                 {player.name: {"score": player.score, "changes": player.num_changes, "user_id": player.user_id}})
-        json.dump(temp_dict, outfile, sort_keys=True, indent=4)
+        with self._lock:
+            state_persistence.atomic_write_json(self.player_data_file, temp_dict, sort_keys=True, indent=4)
+            self.reload()
+
+
+player_registry = PlayerRegistry()
 
 
-def get_key(key: str):
-    """Opens 'keys.json' and attempts to fetch the passed key."""
-    try:
-        with open('keys.json', 'r+') as read_file:
-            temp_dict = json.load(read_file)
-        return temp_dict[key]
-    except (IOError, FileNotFoundError, json.decoder.JSONDecodeError):
-        pass
+def update_players_scores(players_list: List["Player"]) -> None:
+    """Attempts to update 'player_data.json' with calculated data through the player registry."""
+    player_registry.update_scores(players_list)
@@ -0,0 +1,152 @@
+"""Incremental leaderboard that rescores players only for the teams whose table position moved."""
+import json
+import logging
+from typing import List, Dict, Optional
+
+import numpy as np
+
+import json_readers
+import metrics
+import scoring
+import state_persistence
+from player import Player
+
+LEADERBOARD_SNAPSHOT_FILE = 'leaderboard_snapshot.json'
+
+LEADERBOARD_UPDATE_SECONDS = metrics.histogram("leaderboard_update_seconds",
+                                               "Time spent bringing a leaderboard up to date with the table.")
+
+
+class Leaderboard:
+    """
+    Keeps every player's position differences per team, their scores and the rendered, sorted leaderboard.
+
+    Each new table snapshot is diffed against the previous one and only the columns of teams that moved are
+    recomputed. When nothing moved, nothing is recomputed or written. Score differences are taken against the scores of
+    the previous table snapshot, which is persisted along with the current one in `snapshot_file`.
+    """
+
+    def __init__(self, snapshot_file: Optional[str] = LEADERBOARD_SNAPSHOT_FILE,
+                 registry: Optional[json_readers.PlayerRegistry] = None):
+        self.snapshot_file: Optional[str] = snapshot_file
+        self.registry: Optional[json_readers.PlayerRegistry] = registry  # Defaults to json_readers.player_registry
+        self.names: List[str] = []
+        self.teams: List[str] = []  # Fixed column order of the per-team arrays
+        self.table: List[str] = []
+        self.predicted_positions: np.ndarray = np.zeros((0, 0), dtype=np.int32)
+        self.real_positions: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.diffs: np.ndarray = np.zeros((0, 0), dtype=np.int32)
+        self.penalties: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.scores: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.previous_scores: np.ndarray = np.zeros(0, dtype=np.int64)
+        self.players: List[Player] = []  # Sorted by ascending score
+        self.message: str = ""
+        self._player_data: Optional[dict] = None
+        self._player_tables: Optional[dict] = None
+        self._snapshot_loaded: bool = False
+
+    @metrics.timed(LEADERBOARD_UPDATE_SECONDS)
+    def update(self, tabledata: List[str], player_data: dict, player_tables: dict) -> bool:
+        """
+        Brings the leaderboard up to date with the passed table and players. Returns True if any score was recomputed,
+        in which case the caller should persist() it.
+        """
+        if player_data is None or player_tables is None or not tabledata:
+            return False
+        if not self._snapshot_loaded:
+            self._load_snapshot(player_data, player_tables)
+        if not self._same_players(player_data, player_tables) or set(tabledata) != set(self.teams):
+            self._rebuild(tabledata, player_data, player_tables)
+            return True
+        return self._apply_table(tabledata)
+
+    def _same_players(self, player_data: dict, player_tables: dict) -> bool:
+        """True if the predicted tables and changes of the players are those the leaderboard was built from."""
+        if player_data is self._player_data and player_tables is self._player_tables:
+            return True
+        if player_tables != self._player_tables or list(player_tables) != self.names \
+                or any(player_data[x]["changes"] != self._player_data[x]["changes"] for x in self.names):
+            return False
+        self._player_data, self._player_tables = player_data, player_tables
+        return True
+
+    def _rebuild(self, tabledata: List[str], player_data: dict, player_tables: dict,
+                 previous_scores: Dict[str, int] = None) -> None:
+        """Scores every player from scratch against tabledata."""
+        previous_scores = previous_scores if previous_scores is not None else \
+            {name: int(score) for name, score in zip(self.names, self.scores)}
+        self._player_data, self._player_tables = player_data, player_tables
+        self.names = list(player_tables.keys())
+        self.teams = list(tabledata)
+        self.predicted_positions = scoring.encode_predictions([player_tables[x] for x in self.names],
+                                                              scoring.build_position_index(self.teams))
+        self.penalties = np.asarray([player_data[x]["changes"] for x in self.names], dtype=np.int64) \
+            * scoring.PENALTY_PER_CHANGE
+        self.real_positions = np.arange(len(self.teams), dtype=np.int32)
+        self.diffs = np.abs(self.predicted_positions.astype(np.int32) - self.real_positions)
+        self.previous_scores = np.asarray([previous_scores.get(x, player_data[x]["score"]) for x in self.names],
+                                          dtype=np.int64)
+        self.scores = self.diffs.sum(axis=1, dtype=np.int64) + self.penalties
+        self.table = list(tabledata)
+        self._render()
+
+    def _apply_table(self, tabledata: List[str]) -> bool:
+        """Recomputes only the contributions of teams whose position changed. Returns False if none moved."""
+        position_index = scoring.build_position_index(tabledata)
+        new_positions = np.asarray([position_index[x] for x in self.teams], dtype=np.int32)
+        moved = np.flatnonzero(new_positions != self.real_positions)
+        if moved.size == 0:
+            return False
+        new_diffs = np.abs(self.predicted_positions[:, moved].astype(np.int32) - new_positions[moved])
+        self.previous_scores = self.scores.copy()
+        self.scores = self.scores + new_diffs.sum(axis=1, dtype=np.int64) \
+            - self.diffs[:, moved].sum(axis=1, dtype=np.int64)
+        self.diffs[:, moved] = new_diffs
+        self.real_positions = new_positions
+        self.table = list(tabledata)
+        self._render()
+        return True
+
+    def _render(self) -> None:
+        """Rebuilds the sorted Player objects and the cached leaderboard message."""
+        order = np.argsort(self.real_positions)  # Columns in the order of the real table
+        batch = scoring.summarize_diffs(self.names, self.scores, self.diffs[:, order], self.table)
+        players = [Player(name, self._player_tables[name], self._player_data[name]["changes"], self.table,
+                          int(self.previous_scores[index]), self._player_data[name].get("user_id", 0),
+                          score_result=batch.result(index))
+                   for index, name in enumerate(self.names)]
+        self.players = sorted(players, key=lambda x: x.score)
+        self.message = "".join([x.generate_telegram_string() for x in self.players])
+
+    def _load_snapshot(self, player_data: dict, player_tables: dict) -> None:
+        """Restores the last scored table and the scores before it, so differences survive restarts."""
+        self._snapshot_loaded = True
+        if self.snapshot_file is None:
+            return
+        try:
+            with open(self.snapshot_file, encoding="utf8") as file:
+                snapshot: dict = json.load(file)
+            if set(snapshot["table"]) == {team for table in player_tables.values() for team in table}:
+                self._rebuild(snapshot["table"], player_data, player_tables, snapshot["previous_scores"])
+        except (IOError, FileNotFoundError, json.decoder.JSONDecodeError, KeyError, ValueError):
+            pass
+
+    def persist(self) -> None:
+        """Writes the scored table snapshot and the players' scores to disk."""
+        if self.snapshot_file is not None:
+            try:
+                state_persistence.atomic_write_json(
+                    self.snapshot_file,
+                    {"table": self.table,
+                     "scores": {x: int(y) for x, y in zip(self.names, self.scores)},
+                     "previous_scores": {x: int(y) for x, y in zip(self.names, self.previous_scores)}},
+                    ensure_ascii=False, indent=4)
+            except IOError:
+                logging.exception("Failed to persist the leaderboard snapshot.")
+        if self.registry is not None:
+            self.registry.update_scores(self.players)
+        else:
+            json_readers.update_players_scores(self.players)
+
+
+leaderboard = Leaderboard()
@@ -0,0 +1,148 @@
+"""Per-chat prediction leagues, each with its own players, predictions, leaderboard and scheduled score message."""
+import json
+import os
+import threading
+import traceback
+from typing import Dict, Iterator, List, Optional, Tuple, TYPE_CHECKING
+
+import config
+import json_readers
+from json_readers import PlayerRegistry
+
+if TYPE_CHECKING:  # The leaderboard and its scoring dependencies are imported when a league first scores
+    import leaderboard
+
+LEAGUES_DIRECTORY = 'leagues'  # Holds one subdirectory per group chat, named after its chat id
+
+
+def split_player_key(player_key: str) -> Tuple[str, str]:
+    """Splits a player's prediction key into the namespace of their league and their name."""
+    namespace, separator, name = player_key.rpartition("/")
+    return namespace + separator, name
+
+
+class League:
+    """
+    The players, leaderboard and prediction namespace of one group chat.
+
+    Fixtures, the league table and their scrapes are shared by all leagues. Predictions live in the shared fixture
+    store under player keys prefixed with the league's namespace, so players of different groups never collide.
+    """
+
+    def __init__(self, chat_id: Optional[int], registry: Optional[PlayerRegistry] = None,
+                 league_leaderboard: Optional["leaderboard.Leaderboard"] = None, namespace: str = ""):
+        self.chat_id: Optional[int] = chat_id
+        self._registry: Optional[PlayerRegistry] = registry
+        self._leaderboard: Optional["leaderboard.Leaderboard"] = league_leaderboard
+        self._directory: Optional[str] = None
+        self.namespace: str = namespace
+
+    @classmethod
+    def from_directory(cls, chat_id: int, directory: str) -> "League":
+        """A league whose player files and leaderboard snapshot are kept in the passed directory."""
+        registry = PlayerRegistry(os.path.join(directory, json_readers.PLAYER_DATA_FILE),
+                                  os.path.join(directory, json_readers.PLAYER_TABLES_FILE))
+        league = cls(chat_id, registry, namespace=f"{chat_id}/")
+        league._directory = directory
+        return league
+
+    @property
+    def registry(self) -> PlayerRegistry:
+        """The league's players. The default league uses the player files of the working directory."""
+        return self._registry if self._registry is not None else json_readers.player_registry
+
+    @property
+    def leaderboard(self) -> "leaderboard.Leaderboard":
+        """
+        The league's leaderboard, created on first use. The default league uses the working directory's leaderboard
+        snapshot.
+        """
+        import leaderboard
+        if self._leaderboard is None:
+            if self._directory is None:
+                return leaderboard.leaderboard
+            self._leaderboard = leaderboard.Leaderboard(
+                os.path.join(self._directory, leaderboard.LEADERBOARD_SNAPSHOT_FILE), self._registry)
+        return self._leaderboard
+
+    def player_key(self, name: Optional[str]) -> Optional[str]:
+        """Key of the player's predictions in the shared fixture store."""
+        return None if name is None else self.namespace + name
+
+    def get_player_data_and_player_tables(self) -> Tuple[Optional[dict], Optional[dict]]:
+        """Returns the league's player data and player tables, or Nones if they cannot be read."""
+        try:
+            return self.registry.get_player_data_and_player_tables()
+        except (IOError, FileNotFoundError, json.decoder.JSONDecodeError):
+            print(traceback.format_exc())
+            return None, None
+
+    def get_player_name_by_id(self, user_id: object) -> Optional[str]:
+        """Returns the name of the league's player with the passed telegram user_id, if registered."""
+        try:
+            return self.registry.get_name_by_id(user_id)
+        except (IOError, FileNotFoundError, json.decoder.JSONDecodeError):
+            return None
+
+    def get_player_key_by_id(self, user_id: object) -> Optional[str]:
+        """Returns the prediction key of the league's player with the passed telegram user_id, if registered."""
+        return self.player_key(self.get_player_name_by_id(user_id))
+
+    def player_keys(self) -> List[str]:
+        """Prediction keys of all the league's players."""
+        player_data = self.get_player_data_and_player_tables()[0] or {}
+        return [self.player_key(x) for x in player_data]
+
+
+class LeagueDirectory:
+    """
+    Leagues keyed by chat id for O(1) lookup from incoming updates.
+
+    Every subdirectory of `directory` named after a chat id and holding a player tables file is a league of its own.
+    Chats without one are served by the default league, which keeps the single-group files of the working directory.
+    """
+
+    def __init__(self, default: League, directory: str = LEAGUES_DIRECTORY):
+        self.default: League = default
+        self.directory: str = directory
+        self._by_chat: Dict[int, League] = {}
+        self._lock = threading.Lock()
+
+    def discover(self) -> List[League]:
+        """Registers the leagues found in the leagues directory that are not registered yet and returns them."""
+        try:
+            entries = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        added = []
+        for entry in sorted(entries):
+            path = os.path.join(self.directory, entry)
+            if entry.lstrip("-").isdigit() and os.path.exists(os.path.join(path, json_readers.PLAYER_TABLES_FILE)) \
+                    and int(entry) not in self._by_chat:
+                added.append(self.register(League.from_directory(int(entry), path)))
+        return added
+
+    def register(self, league: League) -> League:
+        """Registers the passed league for its chat, replacing any league the chat had."""
+        with self._lock:
+            self._by_chat = {**self._by_chat, league.chat_id: league}
+        return league
+
+    def get(self, chat_id: Optional[int]) -> League:
+        """Returns the league of the passed chat, or the default league."""
+        return self._by_chat.get(chat_id, self.default)
+
+    def __iter__(self) -> Iterator[League]:
+        """The default league, unless its chat has a league of its own, followed by the registered ones."""
+        by_chat = self._by_chat
+        if self.default.chat_id not in by_chat:
+            yield self.default
+        yield from by_chat.values()
+
+
+directory = LeagueDirectory(League(config.get_config().group_chat_id))
+
+
+def get_league(chat_id: Optional[int]) -> League:
+    """Returns the league of the passed chat id."""
+    return directory.get(chat_id)
@@ -6,29 +6,84 @@ Telegram API.
 
 @authors flamprakis, Konoszaf1
 """
+import asyncio
 import datetime
+import importlib
 import logging
 import time
 import socket
+from http.server import ThreadingHTTPServer
+from typing import Optional
 
-import pytz
 import telegram
 from telegram import ext
 
-import json_readers
+import config
+import fixture_refresher
+import fixtures
+import http_client
+import leagues
+import metrics
+import outbound
+import sources
 import telegram_messaging
+import web_scrapping
 
-BOT_TOKEN = json_readers.get_key("BOT_TOKEN")
-GROUP_CHAT_ID = json_readers.get_key("GROUP_CHAT_ID")
+SCORE_JOB_TIME = datetime.time(hour=23, minute=00, tzinfo=fixtures.TIMEZONE)
+TELEGRAM_POOL_SIZE = 32  # Connections to the Bot API, shared by concurrently handled updates
+# Scraping, parsing and scoring dependencies that are imported on first use instead of at startup
+DEFERRED_IMPORTS = ("lxml.etree", "requests_html", "numpy", "leaderboard")
 
+_metrics_server: Optional[ThreadingHTTPServer] = None
 
-def handle_message(update: telegram.Update, context: ext.CallbackContext):
+
+async def handle_message(update: telegram.Update, context: ext.ContextTypes.DEFAULT_TYPE):
     """Redirects received message with passed arguments to telegram_messaging to handle it according to text."""
-    telegram_messaging.handle_received_message(update, context)
+    await telegram_messaging.handle_received_message(update, context)
+
+async def send_score_job(context: ext.ContextTypes.DEFAULT_TYPE):
+    """Job to send the score leaderboard of a league to its group chat every day at 23:00 GMT+2"""
+    await telegram_messaging.telegram_bot_send_score(context.bot, chat_id=context.job.chat_id)
+
+
+def schedule_score_jobs(job_queue: ext.JobQueue) -> None:
+    """Schedules the daily score message of every league that has a group chat."""
+    for league in leagues.directory:
+        if league.chat_id is not None:
+            job_queue.run_daily(send_score_job, SCORE_JOB_TIME, days=tuple(range(7)), chat_id=league.chat_id,
+                                name=f"send_score_{league.chat_id}")
+
+
+async def stop(application: ext.Application):
+    """Delivers the queued outbound messages while the bot can still reach the Telegram API."""
+    await outbound.queue.drain()
+
 
-def send_score_job(context: telegram.ext.CallbackContext):
-    """Job to send the score leaderboards to the group chat every day at 23:00 GMT+2"""
-    telegram_messaging.telegram_bot_send_score(context.bot, chat_id=GROUP_CHAT_ID)
+async def shutdown(application: ext.Application):
+    """
+    Writes pending predictions, closes the pooled HTTP connections of the scrapers and stops their parser processes
+    when the bot stops.
+    """
+    await asyncio.to_thread(fixtures.flush_predictions)
+    await http_client.close_client()
+    sources.close_pool()
+
+
+def warm_caches() -> None:
+    """Imports the deferred dependencies and loads the fixture index and the players of every league."""
+    for module in DEFERRED_IMPORTS:
+        importlib.import_module(module)
+    fixtures.get_index()
+    for league in leagues.directory:
+        league.get_player_data_and_player_tables()
+
+
+async def warm_caches_job(context: ext.ContextTypes.DEFAULT_TYPE):
+    """Warms the caches in an executor thread once polling has started, so that the first user does not wait for it."""
+    start = time.perf_counter()
+    await asyncio.to_thread(warm_caches)
+    await web_scrapping.get_table()
+    logging.info(f"Warmed caches in {time.perf_counter() - start:.2f}s.")
 
 
 def is_connected_to_internet(host="8.8.8.8", port=53, timeout=3) -> bool:
@@ -41,20 +96,35 @@ def is_connected_to_internet(host="8.8.8.8", port=53, timeout=3) -> bool:
         return False
 
 
+def start_instrumentation(settings: config.Config) -> None:
+    """Starts the metrics endpoint and the profiler if configured, once, as main runs again after a network error."""
+    global _metrics_server
+    if settings.metrics_port and _metrics_server is None:
+        _metrics_server = metrics.start_metrics_server(settings.metrics_port)
+    if settings.profiler_enabled:
+        metrics.profiler.start()  # No-op while it is running
+
+
 def main():
     logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
-    # Setup and run bot
-    updater = ext.Updater(token=BOT_TOKEN, use_context=True)
-    job_queue: ext.JobQueue = updater.job_queue
-    job_minute = job_queue.run_daily(send_score_job,
-                                     datetime.time(hour=23, minute=00, tzinfo=pytz.timezone('Europe/Athens')),
-                                     days=tuple(range(7)))
-    dispatcher = updater.dispatcher
-    message_handler = ext.MessageHandler(ext.Filters.text & (~ext.Filters.command), handle_message)
-    dispatcher.add_handler(message_handler)
+    settings = config.get_config()
+    start_instrumentation(settings)
+    # Setup and run bot, handling updates of different users concurrently
+    application = ext.Application.builder().token(settings.bot_token).concurrent_updates(True) \
+        .post_stop(stop).post_shutdown(shutdown) \
+        .request(telegram_messaging.InstrumentedRequest(connection_pool_size=TELEGRAM_POOL_SIZE)).build()
+    job_queue: ext.JobQueue = application.job_queue
+    leagues.directory.discover()
+    schedule_score_jobs(job_queue)
+    fixture_refresher.schedule_fixture_refresh(job_queue)
+    if settings.warm_caches:
+        job_queue.run_once(warm_caches_job, when=0, name="warm_caches")
+    message_handler = ext.MessageHandler(ext.filters.TEXT & (~ext.filters.COMMAND), handle_message)
+    application.add_handler(message_handler)
+    application.add_handler(ext.CommandHandler(telegram_messaging.HISTORY_COMMANDS,
+                                               telegram_messaging.handle_history_command))
     logging.info("Listening...")
-    updater.start_polling()
-    updater.idle()
+    application.run_polling()
 
 
 def start_bot():
@@ -0,0 +1,281 @@
+"""
+In-process counters and latency histograms of the bot's hot paths, a local Prometheus-style text endpoint exposing
+them and an optional sampling profiler.
+
+Recording a sample is a lock-protected dict update, cheap enough to leave on in production. The endpoint serves
+    /metrics                 all metrics in the Prometheus text exposition format
+    /debug/profile/start     starts the sampling profiler
+    /debug/profile/stop      stops it
+    /debug/profile           the sampled stacks so far, collapsed one per line for flamegraph tools
+"""
+import asyncio
+import bisect
+import functools
+import logging
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+METRICS_HOST = "127.0.0.1"
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PROFILER_INTERVAL = 0.005  # Seconds between stack samples of the sampling profiler
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    pairs = ",".join('{}="{}"'.format(name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                     for name, value in key)
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    """A named metric with one series per distinct set of labels."""
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name: str = name
+        self.documentation: str = documentation
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterator[Tuple[str, LabelKey, float]]:
+        return iter(())
+
+    def render(self) -> List[str]:
+        """The metric in the Prometheus text exposition format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{_format_labels(key)} {_format_value(value)}" for name, key, value in self.samples())
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing count, e.g. of cache hits or failures."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterator[Tuple[str, LabelKey, float]]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield f"{self.name}_total", key, value
+
+
+class Histogram(Metric):
+    """Distribution of observed values, e.g. latencies in seconds, counted into cumulative buckets."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, List[float]] = {}  # Per bucket counts, the +Inf count and the sum last
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def time(self, **labels) -> "Timer":
+        """Context manager observing the seconds spent in its block."""
+        return Timer(self, labels)
+
+    def samples(self) -> Iterator[Tuple[str, LabelKey, float]]:
+        with self._lock:
+            series_list = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in series_list:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                yield f"{self.name}_bucket", key + (("le", "+Inf" if bound == float("inf") else repr(bound)),), \
+                    cumulative
+            yield f"{self.name}_sum", key, series[-1]
+            yield f"{self.name}_count", key, cumulative
+
+
+class Timer:
+    """Observes the seconds between entering and exiting it into a histogram."""
+    __slots__ = ("histogram", "labels", "start")
+
+    def __init__(self, histogram: Histogram, labels: Dict[str, object]):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+def timed(histogram: Histogram, **labels) -> Callable:
+    """Decorator observing the duration of every call of a function or coroutine function into histogram."""
+
+    def decorator(func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with Timer(histogram, labels):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Timer(histogram, labels):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class Registry:
+    """All metrics of the process by name."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        """Registers metric, returning the already registered one if a metric of that name exists."""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda x: x.name)
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str) -> Counter:
+    """Returns the registered counter of that name, creating it if needed."""
+    return REGISTRY.register(Counter(name, documentation))
+
+
+def histogram(name: str, documentation: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    """Returns the registered histogram of that name, creating it if needed."""
+    return REGISTRY.register(Histogram(name, documentation, buckets))
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all other threads every `interval` seconds from a daemon thread and counts them. Coroutines of
+    the event loop show up under the main thread. Nothing is sampled while it is stopped.
+    """
+
+    def __init__(self, interval: float = PROFILER_INTERVAL):
+        self.interval: float = interval
+        self.stacks: StackCounter = StackCounter()
+        self.samples: int = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def reset(self) -> None:
+        self.stacks = StackCounter()
+        self.samples = 0
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """The sampled stacks, root first, one "frame;frame;frame count" line each."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+profiler = SamplingProfiler()
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves the metrics and the profiler toggles."""
+
+    def do_GET(self) -> None:
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path == "/metrics":
+            body = REGISTRY.render()
+        elif path == "/debug/profile/start":
+            profiler.reset()
+            profiler.start()
+            body = "profiler started\n"
+        elif path == "/debug/profile/stop":
+            profiler.stop()
+            body = f"profiler stopped after {profiler.samples} samples\n"
+        elif path == "/debug/profile":
+            body = profiler.collapsed()
+        else:
+            self.send_error(404)
+            return
+        content = body.encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args) -> None:
+        logging.debug(f"metrics endpoint: {format % args}")
+
+
+def start_metrics_server(port: int, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    """Serves the metrics endpoint on host:port from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
@@ -0,0 +1,257 @@
+"""
+Queue of the bot's outbound Telegram messages and deletions, delivered in the background within Telegram's rate limits.
+
+Handlers only enqueue. Every chat has its own ordered queue that is drained by a worker task while it has work, so
+chats are served concurrently and operations within a chat keep their order. Consecutive deletions in a chat are merged
+into one deleteMessages call, a keyboard reply superseded by a newer one for the same user before it went out is
+dropped, and flood waits and network failures are retried with backoff.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Union
+
+import telegram
+from telegram.constants import MessageLimit
+
+import metrics
+
+GLOBAL_RATE = 30  # Messages per second over all chats
+CHAT_RATE = 1  # Messages per second in a single chat
+CHAT_BURST = 3  # Messages a chat may receive at once before CHAT_RATE applies
+GROUP_RATE = 20 / 60  # Messages per second in a single group, averaged over a minute
+GROUP_BURST = 20
+MAX_ATTEMPTS = 5  # Attempts of a single operation before it is given up
+BACKOFF_BASE = 0.5  # Seconds before the first retry after a network failure, doubled on each further failure
+DELETE_BATCH_SIZE = 100  # Most message ids a single deleteMessages call accepts
+
+OUTBOUND_OPERATIONS = metrics.counter("outbound_operations", "Queued Telegram operations by kind and outcome.")
+OUTBOUND_RETRIES = metrics.counter("outbound_retries", "Retried Telegram operations by reason.")
+OUTBOUND_SECONDS = metrics.histogram("outbound_seconds", "Time from queueing a Telegram operation to its completion.")
+
+
+class RateLimiter:
+    """Token bucket allowing `rate` operations per second with bursts of up to `capacity` operations."""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate: float = rate
+        self.capacity: float = capacity
+        self.tokens: float = capacity
+        self.updated: float = time.monotonic()
+
+    def reserve(self) -> float:
+        """Takes a token and returns the seconds the caller has to wait before using it."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) - 1
+        self.updated = now
+        return max(0.0, -self.tokens / self.rate)
+
+
+class Send:
+    """A message to send, optionally as a reply to a received message."""
+    __slots__ = ("chat_id", "text", "kwargs", "reply_to", "replace_key", "delete_after_send", "future", "queued_at")
+
+    def __init__(self, chat_id: int, text: str, kwargs: dict, reply_to: Optional[telegram.Message] = None,
+                 replace_key: Optional[Hashable] = None, delete_after_send: bool = False):
+        self.chat_id = chat_id
+        self.text = text
+        self.kwargs = kwargs
+        self.reply_to = reply_to
+        self.replace_key = replace_key
+        self.delete_after_send = delete_after_send
+        self.future: "asyncio.Future[Optional[telegram.Message]]" = asyncio.get_running_loop().create_future()
+        self.queued_at = time.perf_counter()
+
+
+class Delete:
+    """A message to delete."""
+    __slots__ = ("chat_id", "message_id", "future", "queued_at")
+
+    def __init__(self, chat_id: int, message_id: int):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.future: "asyncio.Future[bool]" = asyncio.get_running_loop().create_future()
+        self.queued_at = time.perf_counter()
+
+
+Operation = Union[Send, Delete]
+
+
+class ChatQueue:
+    """The pending operations of one chat and the worker task draining them."""
+    __slots__ = ("chat_id", "operations", "task")
+
+    def __init__(self, chat_id: int):
+        self.chat_id = chat_id
+        self.operations: Deque[Operation] = deque()
+        self.task: Optional[asyncio.Task] = None
+
+
+def _resolve(future: asyncio.Future, result) -> None:
+    if not future.done():  # The caller may have cancelled it
+        future.set_result(result)
+
+
+def _seconds(retry_after: Union[int, float, timedelta]) -> float:
+    return retry_after.total_seconds() if isinstance(retry_after, timedelta) else float(retry_after)
+
+
+def paginate(text: str, limit: int = MessageLimit.MAX_TEXT_LENGTH) -> List[str]:
+    """
+    Splits text into pages of at most limit characters, preferably between paragraphs, else between lines, so that
+    long leaderboards are sent as several messages instead of being rejected.
+    """
+    pages: List[str] = []
+    page = ""
+    for paragraph in text.split("\n\n"):
+        block = paragraph + "\n\n"
+        if len(page) + len(block) <= limit:
+            page += block
+            continue
+        if page:
+            pages.append(page)
+        page = ""
+        while len(block) > limit:
+            cut = block.rfind("\n", 0, limit)
+            cut = cut + 1 if cut > 0 else limit
+            pages.append(block[:cut])
+            block = block[cut:]
+        page = block
+    if page.strip() or not pages:
+        pages.append(page)
+    return [x.rstrip("\n") or x for x in pages]
+
+
+class OutboundQueue:
+    """Per-chat ordered queues of outbound operations, drained concurrently within the global and per-chat limits."""
+
+    def __init__(self):
+        self._chats: Dict[int, ChatQueue] = {}
+        self._chat_limiters: Dict[int, RateLimiter] = {}
+        self._group_limiters: Dict[int, RateLimiter] = {}
+        self._global_limiter = RateLimiter(GLOBAL_RATE, GLOBAL_RATE)
+
+    def send(self, bot: telegram.Bot, chat_id: int, text: str,
+             **kwargs) -> "asyncio.Future[Optional[telegram.Message]]":
+        """Queues a message. The returned future resolves to the sent message, or None if it could not be sent."""
+        return self._enqueue(bot, Send(chat_id, text, kwargs)).future
+
+    def reply(self, message: telegram.Message, text: str, replace_key: Optional[Hashable] = None,
+              delete_after_send: bool = False, **kwargs) -> "asyncio.Future[Optional[telegram.Message]]":
+        """
+        Queues a reply to the passed message. A queued reply with the same replace_key that has not been sent yet is
+        replaced by this one. With delete_after_send, the reply is deleted right after it was sent, e.g. to remove a
+        reply keyboard.
+        """
+        operation = Send(message.chat_id, text, kwargs, message, replace_key, delete_after_send)
+        return self._enqueue(message.get_bot(), operation).future
+
+    def delete(self, bot: telegram.Bot, chat_id: int, message_id: int) -> "asyncio.Future[bool]":
+        """Queues the deletion of a message. The returned future resolves to whether it was deleted."""
+        chat = self._chats.get(chat_id)
+        if chat is not None:
+            for pending in chat.operations:
+                if isinstance(pending, Delete) and pending.message_id == message_id:
+                    return pending.future
+        return self._enqueue(bot, Delete(chat_id, message_id)).future
+
+    def _enqueue(self, bot: telegram.Bot, operation: Operation) -> Operation:
+        chat = self._chats.get(operation.chat_id)
+        if chat is None:
+            chat = self._chats[operation.chat_id] = ChatQueue(operation.chat_id)
+        if isinstance(operation, Send) and operation.replace_key is not None:
+            for index, pending in enumerate(chat.operations):
+                if isinstance(pending, Send) and pending.replace_key == operation.replace_key:
+                    chat.operations[index] = operation
+                    _resolve(pending.future, None)
+                    OUTBOUND_OPERATIONS.inc(kind="send", outcome="superseded")
+                    return operation
+        chat.operations.append(operation)
+        if chat.task is None:
+            chat.task = asyncio.ensure_future(self._run(bot, chat))
+        return operation
+
+    async def _run(self, bot: telegram.Bot, chat: ChatQueue) -> None:
+        try:
+            while chat.operations:
+                operation = chat.operations.popleft()
+                if isinstance(operation, Send):
+                    await self._send(bot, chat, operation)
+                else:
+                    batch = [operation]
+                    while chat.operations and isinstance(chat.operations[0], Delete) \
+                            and len(batch) < DELETE_BATCH_SIZE:
+                        batch.append(chat.operations.popleft())
+                    await self._delete(bot, chat.chat_id, batch)
+        finally:
+            chat.task = None
+            if not chat.operations:
+                self._chats.pop(chat.chat_id, None)
+
+    async def _send(self, bot: telegram.Bot, chat: ChatQueue, operation: Send) -> None:
+        if operation.reply_to is not None:
+            call = lambda: operation.reply_to.reply_text(operation.text, **operation.kwargs)
+        else:
+            call = lambda: bot.send_message(operation.chat_id, operation.text, **operation.kwargs)
+        message = await self._call(operation.chat_id, "send", call, rate_limited=True)
+        if message is not None and operation.delete_after_send:
+            chat.operations.appendleft(Delete(message.chat_id, message.message_id))
+        OUTBOUND_SECONDS.observe(time.perf_counter() - operation.queued_at, kind="send")
+        _resolve(operation.future, message)
+
+    async def _delete(self, bot: telegram.Bot, chat_id: int, batch: List[Delete]) -> None:
+        message_ids = [x.message_id for x in batch]
+        if len(message_ids) == 1:
+            deleted = await self._call(chat_id, "delete", lambda: bot.delete_message(chat_id, message_ids[0]))
+        else:
+            deleted = await self._call(chat_id, "delete", lambda: bot.delete_messages(chat_id, message_ids))
+        for operation in batch:
+            OUTBOUND_SECONDS.observe(time.perf_counter() - operation.queued_at, kind="delete")
+            _resolve(operation.future, bool(deleted))
+
+    def _limiters(self, chat_id: int) -> List[RateLimiter]:
+        limiters = [self._global_limiter, self._chat_limiters.setdefault(chat_id, RateLimiter(CHAT_RATE, CHAT_BURST))]
+        if chat_id < 0:  # Group chats have negative ids
+            limiters.append(self._group_limiters.setdefault(chat_id, RateLimiter(GROUP_RATE, GROUP_BURST)))
+        return limiters
+
+    async def _call(self, chat_id: int, kind: str, call: Callable[[], Awaitable], rate_limited: bool = False):
+        """Runs a Bot API call within the rate limits, retrying flood waits and network failures. None on failure."""
+        for attempt in range(MAX_ATTEMPTS):
+            limiters = self._limiters(chat_id) if rate_limited else [self._global_limiter]
+            wait = max(x.reserve() for x in limiters)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                result = await call()
+                OUTBOUND_OPERATIONS.inc(kind=kind, outcome="done")
+                return result
+            except telegram.error.RetryAfter as error:
+                seconds = _seconds(error.retry_after)
+                OUTBOUND_RETRIES.inc(reason="flood_wait")
+                logging.warning(f"Flood wait of {seconds}s in chat {chat_id}.")
+                await asyncio.sleep(seconds)  # Holds back the rest of the chat's queue as well
+            except telegram.error.BadRequest:
+                logging.exception(f"Telegram rejected a {kind} in chat {chat_id}.")
+                break
+            except (telegram.error.TimedOut, telegram.error.NetworkError):
+                OUTBOUND_RETRIES.inc(reason="network")
+                await asyncio.sleep(BACKOFF_BASE * 2 ** attempt)
+            except telegram.error.TelegramError:
+                logging.exception(f"Failed to {kind} in chat {chat_id}.")
+                break
+        OUTBOUND_OPERATIONS.inc(kind=kind, outcome="failed")
+        return None
+
+    async def drain(self) -> None:
+        """Waits until every queued operation has been delivered or given up."""
+        tasks = [x.task for x in self._chats.values() if x.task is not None]
+        while tasks:
+            await asyncio.gather(*tasks)
+            tasks = [x.task for x in self._chats.values() if x.task is not None]
+
+
+queue = OutboundQueue()
@@ -1,6 +1,6 @@
 from typing import List
 
-import web_scrapping
+import scoring
 
 
 class Player:
@@ -10,17 +10,21 @@ class Player:
     Provides methods for calculating score, max_diff_element, perfect_guess_element
     """
 
-    def __init__(self, name: str, player_table: List[str], num_changes: int, tabledata: List[str], previous_score: int, user_id: int):
+    def __init__(self, name: str, player_table: List[str], num_changes: int, tabledata: List[str], previous_score: int, user_id: int,
+                 score_result: scoring.ScoreResult = None):
         self.name: str = name
         self.player_table: List[str] = player_table
         self.num_changes: int = num_changes
         self.tabledata: List[str] = tabledata
-        self.penalty: int = 1
+        self.penalty: int = scoring.PENALTY_PER_CHANGE
         self.score: int = 0
         self.max_diff_element: str = ""
         self.perfect_guess_element: str = ""
         self.max_diff: int = 0
-        self.calculate_score()
+        if score_result is None:
+            self.calculate_score()
+        else:
+            self.score, self.max_diff, self.max_diff_element, self.perfect_guess_element = score_result
         self.score_difference = self.score - previous_score
         self.user_id = user_id
     def calculate_score(self) -> None:
@@ -58,14 +62,16 @@ class Player:
         return text
 
 
-def create_player_objects(player_data_dict: dict, player_tables_dict: dict) -> List[Player]:
-    """Create Player class objects with data from passed dictionaries."""
+def create_player_objects(player_data_dict: dict, player_tables_dict: dict, tabledata: List[str]) -> List[Player]:
+    """Create Player class objects with data from passed dictionaries, scored against the passed table."""
     if player_data_dict is None or player_tables_dict is None:
         return []
+    batch = scoring.score_players(player_data_dict, player_tables_dict, tabledata)
     players_list: List[Player] = []
-    for new_player in player_tables_dict.keys():
+    for index, new_player in enumerate(batch.names):
         players_list.append(
             Player(new_player, player_tables_dict[new_player], player_data_dict[new_player]["changes"],
-                   web_scrapping.web_scrape_table(), player_data_dict[new_player]["score"], player_data_dict[new_player]["user_id"]))
+                   tabledata, player_data_dict[new_player]["score"], player_data_dict[new_player]["user_id"],
+                   score_result=batch.result(index)))
     return players_list
 
@@ -0,0 +1,95 @@
+"""Vectorized batch scoring of every player's predicted table against the real table."""
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+PENALTY_PER_CHANGE = 1
+
+
+class ScoreResult(NamedTuple):
+    """Scoring outcome of a single predicted table."""
+    score: int
+    max_diff: int
+    max_diff_element: str
+    perfect_guess_element: str
+
+
+class ScoreBatch(NamedTuple):
+    """Scoring outcome of a batch of predicted tables, one row per player."""
+    names: List[str]
+    scores: np.ndarray
+    max_diffs: np.ndarray
+    max_diff_elements: List[str]
+    perfect_guess_elements: List[str]
+
+    def result(self, index: int) -> ScoreResult:
+        """Returns the ScoreResult of the player at the passed row."""
+        return ScoreResult(int(self.scores[index]), int(self.max_diffs[index]), self.max_diff_elements[index],
+                           self.perfect_guess_elements[index])
+
+
+def build_position_index(tabledata: List[str]) -> Dict[str, int]:
+    """Maps every team of the real table to its position. Built once per table snapshot."""
+    return {team: position for position, team in enumerate(tabledata)}
+
+
+def encode_predictions(player_tables: List[List[str]], position_index: Dict[str, int]) -> np.ndarray:
+    """
+    Encodes predicted tables as a matrix where cell [i, k] is the position player i predicted for the k-th team of the
+    real table.
+    """
+    num_teams = len(position_index)
+    predicted_positions = np.full((len(player_tables), num_teams), -1, dtype=np.int16)
+    for row, player_table in enumerate(player_tables):
+        for predicted_position, team in enumerate(player_table[:num_teams]):
+            real_position = position_index.get(team)
+            if real_position is not None:
+                predicted_positions[row, real_position] = predicted_position
+    missing = np.argwhere(predicted_positions < 0)
+    if missing.size:
+        row, column = missing[0]
+        team = next(team for team, position in position_index.items() if position == column)
+        raise ValueError(f"'{team}' is not in predicted table number {row}")
+    return predicted_positions
+
+
+def score_tables(names: List[str], player_tables: List[List[str]], num_changes: List[int],
+                 tabledata: List[str]) -> ScoreBatch:
+    """
+    Scores every predicted table against tabledata in one pass.
+
+    Produces the same results as Player.calculate_score: the score is the sum of absolute position differences plus the
+    change penalty, the max diff element is the first team of the real table with the largest difference and the
+    perfect guess element is the last team of the real table that was placed correctly.
+    """
+    penalties = np.asarray(num_changes, dtype=np.int64) * PENALTY_PER_CHANGE
+    if not names or not tabledata:
+        return ScoreBatch(list(names), penalties, np.zeros(len(names), dtype=np.int64), [""] * len(names),
+                          [""] * len(names))
+    position_index = build_position_index(tabledata)
+    predicted_positions = encode_predictions(player_tables, position_index)
+    diffs = np.abs(predicted_positions.astype(np.int32) - np.arange(len(tabledata), dtype=np.int32))
+    scores = diffs.sum(axis=1, dtype=np.int64) + penalties
+    return summarize_diffs(names, scores, diffs, tabledata)
+
+
+def summarize_diffs(names: List[str], scores: np.ndarray, diffs: np.ndarray, tabledata: List[str]) -> ScoreBatch:
+    """
+    Builds a ScoreBatch from the passed scores and position differences, whose columns follow the order of tabledata.
+    """
+    teams = np.array(tabledata, dtype=object)
+    max_diffs = diffs.max(axis=1).astype(np.int64)
+    max_diff_elements = np.where(max_diffs > 0, teams[diffs.argmax(axis=1)], "")
+
+    perfect = diffs == 0
+    last_perfect = diffs.shape[1] - 1 - perfect[:, ::-1].argmax(axis=1)
+    perfect_guess_elements = np.where(perfect.any(axis=1), teams[last_perfect], "")
+
+    return ScoreBatch(list(names), scores, max_diffs, max_diff_elements.tolist(), perfect_guess_elements.tolist())
+
+
+def score_players(player_data_dict: dict, player_tables_dict: dict, tabledata: List[str]) -> ScoreBatch:
+    """Scores all players of the passed json dictionaries against tabledata."""
+    names = list(player_tables_dict.keys())
+    return score_tables(names, [player_tables_dict[name] for name in names],
+                        [player_data_dict[name]["changes"] for name in names], tabledata)
@@ -0,0 +1,182 @@
+"""
+Vectorized settlement of the players' 1/X/2 predictions against fixture results.
+
+Settled fixtures are kept as columns of a pick matrix with one row per player slot, so points, streaks and weekly
+standings of every player come out of a few array operations instead of a loop over fixtures per player. Fixtures are
+settled incrementally: each call only encodes the fixtures that settled since the previous one.
+"""
+import threading
+from datetime import date
+from typing import Iterable, List, NamedTuple, Optional
+
+import numpy as np
+
+import fixtures
+import metrics
+
+POINTS_PER_HIT = 1  # Points of a correct 1/X/2 prediction, taken off the lower-is-better table score when combined
+PICKS = ("1", "X", "2")  # Picks and outcomes are encoded as their index in PICKS, -1 meaning no pick
+
+SETTLEMENT_SECONDS = metrics.histogram("settlement_seconds", "Time spent settling fixtures and computing standings.")
+
+_PICK_CODES = np.full(256, -1, dtype=np.int8)  # Character code of a prediction to its pick code
+for _code, _pick in enumerate(PICKS):
+    _PICK_CODES[ord(_pick)] = _code
+
+
+def encode_outcome(result: str) -> int:
+    """Pick code of the outcome of a 'home:away' result, or -1 if it cannot be parsed."""
+    try:
+        home_goals, away_goals = (int(x) for x in result.split(":"))
+    except ValueError:
+        return -1
+    return 0 if home_goals > away_goals else 1 if home_goals == away_goals else 2
+
+
+def encode_picks(prediction_slots: str) -> np.ndarray:
+    """Pick codes of a fixture's prediction string, one per player slot."""
+    return _PICK_CODES[np.frombuffer(prediction_slots.encode("ascii", "replace"), dtype=np.uint8)]
+
+
+class Standings(NamedTuple):
+    """Settled prediction statistics, one row per player slot."""
+    players: List[str]  # Player keys in slot order
+    points: np.ndarray
+    hits: np.ndarray
+    predictions: np.ndarray  # Settled fixtures the player predicted
+    current_streaks: np.ndarray  # Correct predictions since the player's last wrong one
+    longest_streaks: np.ndarray
+    weeks: List[date]  # Monday of every week with settled fixtures, ascending
+    weekly_points: np.ndarray  # Points per player and week
+
+    def rows(self, player_keys: Iterable[str]) -> np.ndarray:
+        """Rows of the passed players, -1 for players without a row."""
+        index = {x: row for row, x in enumerate(self.players)}
+        return np.asarray([index.get(x, -1) for x in player_keys], dtype=np.int64)
+
+    def week_points(self, day: date) -> np.ndarray:
+        """Every player's points in the week of the passed day."""
+        monday = date.fromordinal(day.toordinal() - day.weekday())
+        if monday not in self.weeks:
+            return np.zeros(len(self.players), dtype=np.int64)
+        return self.weekly_points[:, self.weeks.index(monday)]
+
+
+class CombinedScore(NamedTuple):
+    """A player's table-position score combined with their prediction points."""
+    name: str
+    total: int
+    table_score: int
+    points: int
+    week_points: int
+    current_streak: int
+
+
+def combine(standings: Standings, names: List[str], player_keys: List[str], table_scores: np.ndarray,
+            day: date) -> List[CombinedScore]:
+    """
+    Combines the table scores of the passed players with their prediction points, lowest, i.e. best, total first.
+    """
+    rows = standings.rows(player_keys)
+    found = rows >= 0
+    rows = np.where(found, rows, 0)
+
+    def gather(values: np.ndarray) -> np.ndarray:
+        return np.where(found, values[rows], 0) if len(values) else np.zeros(len(rows), dtype=np.int64)
+
+    points, week_points, streaks = gather(standings.points), gather(standings.week_points(day)), \
+        gather(standings.current_streaks)
+    totals = np.asarray(table_scores, dtype=np.int64) - points
+    return [CombinedScore(names[x], int(totals[x]), int(table_scores[x]), int(points[x]), int(week_points[x]),
+                          int(streaks[x])) for x in np.argsort(totals, kind="stable")]
+
+
+class SettlementEngine:
+    """Pick matrix of the settled fixtures, grown incrementally, and the standings computed from it."""
+
+    def __init__(self):
+        self.fixture_columns: dict = {}  # Fixture key to its column
+        self.outcomes: np.ndarray = np.zeros(0, dtype=np.int8)
+        self.days: np.ndarray = np.zeros(0, dtype=np.int64)  # Proleptic ordinal of every fixture's match date
+        self.kickoffs: List = []  # Match datetimes, ordering the columns for streaks
+        self.picks: np.ndarray = np.zeros((0, 0), dtype=np.int8)
+        self._standings: Optional[Standings] = None
+        self._lock = threading.Lock()
+
+    @metrics.timed(SETTLEMENT_SECONDS, operation="settle")
+    def settle(self, fixtures_list: Iterable[fixtures.Fixture], current=None) -> int:
+        """
+        Adds the fixtures that settled since the last call to the pick matrix and updates the outcomes of settled
+        fixtures whose result was corrected. Returns the number of newly settled fixtures.
+        """
+        with self._lock:
+            new_fixtures = []
+            for fixture in fixtures_list:
+                column = self.fixture_columns.get(fixture.key)
+                if column is None:
+                    if fixtures.is_settled(fixture, current) and encode_outcome(fixture.result) >= 0:
+                        new_fixtures.append(fixture)
+                elif encode_outcome(fixture.result) not in (-1, self.outcomes[column]):
+                    self.outcomes[column] = encode_outcome(fixture.result)
+                    self._standings = None
+            if not new_fixtures:
+                return 0
+            slots = max([self.picks.shape[0]] + [len(x.prediction_slots) for x in new_fixtures])
+            picks = np.full((slots, self.picks.shape[1] + len(new_fixtures)), -1, dtype=np.int8)
+            picks[:self.picks.shape[0], :self.picks.shape[1]] = self.picks
+            for offset, fixture in enumerate(new_fixtures):
+                column = self.picks.shape[1] + offset
+                encoded = encode_picks(fixture.prediction_slots)
+                picks[:len(encoded), column] = encoded
+                self.fixture_columns[fixture.key] = column
+            self.picks = picks
+            self.outcomes = np.concatenate([self.outcomes, [encode_outcome(x.result) for x in new_fixtures]]) \
+                .astype(np.int8)
+            self.days = np.concatenate([self.days, [x.match_datetime.toordinal() for x in new_fixtures]]) \
+                .astype(np.int64)
+            self.kickoffs.extend(x.match_datetime for x in new_fixtures)
+            self._standings = None
+            return len(new_fixtures)
+
+    @metrics.timed(SETTLEMENT_SECONDS, operation="standings")
+    def standings(self) -> Standings:
+        """Points, streaks and weekly points of every player slot, recomputed only after fixtures settled."""
+        with self._lock:
+            if self._standings is None:
+                self._standings = self._compute()
+            return self._standings
+
+    def _compute(self) -> Standings:
+        player_keys = list(fixtures.player_slots.names)
+        players, columns = len(player_keys), self.picks.shape[1]
+        picks = np.full((players, columns), -1, dtype=np.int8)
+        rows = min(players, self.picks.shape[0])
+        order = sorted(range(columns), key=self.kickoffs.__getitem__)  # Kickoff order, for streaks
+        picks[:rows] = self.picks[:rows][:, order]
+        outcomes, days = self.outcomes[order], self.days[order]
+        predicted = picks >= 0
+        hits = predicted & (picks == outcomes)
+        misses = predicted & ~hits
+        # A streak is a run of hits between misses, skipping fixtures the player did not predict
+        runs = np.cumsum(misses, axis=1)
+        run_keys = np.arange(players)[:, None] * (columns + 1) + runs
+        run_lengths = np.bincount(run_keys.ravel(), weights=hits.ravel(), minlength=players * (columns + 1)) \
+            .reshape(players, columns + 1).astype(np.int64)
+        current_streaks = run_lengths[np.arange(players), runs[:, -1]] if columns else np.zeros(players, np.int64)
+        mondays = days - (days - 1) % 7  # Ordinal 1 is a Monday
+        weeks, week_of_column = np.unique(mondays, return_inverse=True)
+        player_rows, hit_columns = np.nonzero(hits)
+        weekly_points = np.bincount(player_rows * len(weeks) + week_of_column[hit_columns],
+                                    minlength=players * len(weeks)).reshape(players, len(weeks)) * POINTS_PER_HIT
+        hit_counts = hits.sum(axis=1, dtype=np.int64)
+        return Standings(player_keys, hit_counts * POINTS_PER_HIT, hit_counts, predicted.sum(axis=1, dtype=np.int64),
+                         current_streaks, run_lengths.max(axis=1, initial=0), [date.fromordinal(int(x)) for x in weeks],
+                         weekly_points.astype(np.int64))
+
+
+engine = SettlementEngine()
+
+
+def settle_indexed_fixtures(current=None) -> int:
+    """Settles the indexed fixtures that finished since the last call. Returns the number of newly settled ones."""
+    return engine.settle(fixtures.get_index().by_key.values(), current)
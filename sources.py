@@ -0,0 +1,146 @@
+"""
+Registry of the upstream pages the bot scrapes, one source per competition and kind of page.
+
+A source pairs a URL with an extractor that turns the fetched body into plain fixture records or a league table.
+Sources are fetched concurrently through the pooled HTTP client and their extractors run in a process pool, so a
+refresh of several competitions takes about as long as its slowest source and HTML parsing never holds the event loop
+or the GIL of the bot. Extracted records are normalized into Fixture objects in the bot's process.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+import config
+import fixtures
+import http_client
+import metrics
+import web_scrapping
+
+FIXTURES = "fixtures"
+TABLE = "table"
+ONEFOOTBALL_FIXTURES_URL = "https://onefootball.com/en/competition/{}/fixtures"
+SKYSPORTS_TABLE_URL = "https://www.skysports.com/{}-table"
+PREMIER_LEAGUE = "premier-league"
+PARSER_PROCESSES = 4  # Upper bound of the parser processes, also bounded by the CPU count
+
+SOURCE_PARSE_SECONDS = metrics.histogram("source_parse_seconds",
+                                         "Time spent extracting fetched pages in the parser pool, by source.")
+
+_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+
+class Source(NamedTuple):
+    """An upstream page of one competition and the extractor of its body."""
+    name: str
+    competition: str
+    kind: str  # FIXTURES, extracted into fixture records, or TABLE, extracted into team names in table order
+    url: str
+    extractor: Callable[[bytes], list]  # Module-level function, so that it can run in a parser process
+
+
+class SourceRegistry:
+    """Registered sources by name, in registration order."""
+
+    def __init__(self):
+        self._sources: Dict[str, Source] = {}
+
+    def register(self, source: Source) -> Source:
+        """Registers the passed source, replacing any source of the same name."""
+        self._sources[source.name] = source
+        return source
+
+    def table(self, competition: str) -> Optional[Source]:
+        """The table source of the passed competition, if one is registered."""
+        return self._sources.get(f"{competition}-{TABLE}")
+
+    def enabled(self, kind: str) -> List[Source]:
+        """Sources of the passed kind that are enabled in the config. All of them if the config names none."""
+        names = config.get_config().sources
+        return [x for x in self if x.kind == kind and (names is None or x.name in names)]
+
+    def __iter__(self) -> Iterator[Source]:
+        return iter(list(self._sources.values()))
+
+
+def extract_fixture_records(content: bytes) -> List[fixtures.FixtureRecord]:
+    """Extractor of onefootball fixtures pages. Returns records, which are cheaper to send between processes."""
+    return [x.to_record() for x in fixtures.parse_fixtures_page(content)]
+
+
+def extract_table(content: bytes) -> List[str]:
+    """Extractor of skysports league table pages."""
+    return web_scrapping.parse_table_html(content.decode("utf8", "replace"))
+
+
+def fixtures_source(competition: str, onefootball_slug: str) -> Source:
+    url = ONEFOOTBALL_FIXTURES_URL.format(onefootball_slug)
+    return Source(f"{competition}-{FIXTURES}", competition, FIXTURES, url, extract_fixture_records)
+
+
+def table_source(competition: str) -> Source:
+    return Source(f"{competition}-{TABLE}", competition, TABLE, SKYSPORTS_TABLE_URL.format(competition), extract_table)
+
+
+registry = SourceRegistry()
+registry.register(fixtures_source(PREMIER_LEAGUE, "premier-league-9"))
+registry.register(fixtures_source("championship", "championship-27"))
+registry.register(fixtures_source("fa-cup", "fa-cup-17"))
+registry.register(fixtures_source("champions-league", "champions-league-5"))
+registry.register(fixtures_source("europa-league", "europa-league-7"))
+registry.register(table_source(PREMIER_LEAGUE))
+registry.register(table_source("championship"))
+
+
+def get_pool() -> Optional[concurrent.futures.ProcessPoolExecutor]:
+    """
+    Returns the parser process pool, starting it on first use, or None on a single CPU, where parsing in threads is
+    as fast. Workers are spawned rather than forked, as forking a process that runs the bot's threads could copy a held
+    lock into the child.
+    """
+    global _pool
+    if _pool is None and (os.cpu_count() or 1) > 1:
+        _pool = concurrent.futures.ProcessPoolExecutor(max_workers=min(PARSER_PROCESSES, os.cpu_count() or 1),
+                                                       mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def close_pool() -> None:
+    """Shuts the parser process pool down."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def extract(source: Source, content: bytes) -> list:
+    """Runs the source's extractor on the page in the parser pool, or in a thread without one or if it broke."""
+    global _pool
+    with SOURCE_PARSE_SECONDS.time(source=source.name):
+        pool = get_pool()
+        if pool is not None:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(pool, source.extractor, content)
+            except BrokenProcessPool:
+                logging.exception(f"Parser pool broke while extracting {source.name}, restarting it.")
+                _pool = None
+        return await asyncio.to_thread(source.extractor, content)
+
+
+async def scrape(source: Source) -> list:
+    """Fetches the source's page through the shared HTTP client and extracts it in the parser pool."""
+    response = await http_client.fetch(source.url)
+    return await extract(source, response.content)
+
+
+async def scrape_table(competition: str = PREMIER_LEAGUE) -> List[str]:
+    """Scrapes the league table of the passed competition."""
+    return await scrape(registry.table(competition))
+
+
+def to_fixtures(records: List[fixtures.FixtureRecord]) -> List[fixtures.Fixture]:
+    """Normalizes extracted fixture records into Fixture objects."""
+    return [fixtures.Fixture.from_record(x) for x in records]
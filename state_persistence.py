@@ -0,0 +1,161 @@
+"""Crash-safe, lock-protected persistence of the bot's state files."""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Generic, Iterator, List, TypeVar
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+T = TypeVar("T")
+
+_thread_locks: Dict[str, threading.RLock] = {}
+_thread_locks_guard = threading.Lock()
+
+
+def _thread_lock(path: str) -> threading.RLock:
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(os.path.abspath(path), threading.RLock())
+
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Holds an exclusive lock on the passed state file against other threads and other processes. The inter-process lock
+    is taken on a sibling '.lock' file, because the state file itself is replaced on every write.
+    """
+    with _thread_lock(path):
+        with open(path + ".lock", "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+                else:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def atomic_write(path: str, text: str, encoding: str = "utf8") -> None:
+    """
+    Writes text to a temporary file next to path, syncs it and renames it over path, under the file's lock. Readers
+    see either the old or the new content, never a truncated file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    with file_lock(path):
+        descriptor, temp_path = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(descriptor, "w", encoding=encoding) as file:
+                file.write(text)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+def atomic_write_json(path: str, data, **dump_options) -> None:
+    """Serializes data as json and writes it atomically to path."""
+    atomic_write(path, json.dumps(data, **dump_options))
+
+
+class CoalescingFlusher(Generic[T]):
+    """
+    Collects submitted items and passes them to `flush` in batches from a single background thread. Items submitted
+    within `delay` seconds of each other are flushed together, so a burst produces one write.
+    """
+
+    def __init__(self, flush: Callable[[List[T]], None], delay: float = 0.5, name: str = "state-flusher"):
+        self.flush = flush
+        self.delay = delay
+        self.name = name
+        self._items: List[T] = []
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: threading.Thread = None
+
+    def submit(self, item: T) -> None:
+        """Queues an item for the next flush."""
+        with self._condition:
+            self._items.append(item)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def pending(self) -> int:
+        """Number of items waiting for the next flush."""
+        with self._condition:
+            return len(self._items)
+
+    def _take(self) -> List[T]:
+        with self._condition:
+            items, self._items = self._items, []
+        return items
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                while not self._items:
+                    self._condition.wait()
+            time.sleep(self.delay)  # Let the rest of the burst arrive
+            self.flush_now()
+
+    def flush_now(self) -> None:
+        """Flushes the queued items in the calling thread. Items of a failed flush are queued again."""
+        with self._flush_lock:
+            items = self._take()
+            if not items:
+                return
+            try:
+                self.flush(items)
+            except Exception:
+                logging.exception(f"{self.name} failed to flush {len(items)} items, retrying later.")
+                with self._condition:
+                    self._items[:0] = items
+
+
+class Journal:
+    """Append-only json lines file of records that can be replayed to recover state after a crash."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def append(self, record: dict) -> None:
+        """Durably appends a record."""
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with file_lock(self.path):
+            with open(self.path, "a", encoding="utf8") as file:
+                file.write(line)
+                file.flush()
+                os.fsync(file.fileno())
+
+    def replay(self) -> Iterator[dict]:
+        """Yields the journaled records in order, skipping a torn last line."""
+        try:
+            with open(self.path, encoding="utf8") as file:
+                for line in file:
+                    try:
+                        yield json.loads(line)
+                    except json.decoder.JSONDecodeError:
+                        logging.warning(f"Skipping a torn record of {self.path}.")
+        except FileNotFoundError:
+            return
+
+    def truncate(self) -> None:
+        """Empties the journal once its records are reflected in the main state."""
+        atomic_write(self.path, "")
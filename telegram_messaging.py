@@ -1,112 +1,215 @@
 """ File consists of helper functions that facilitate communication with telegram"""
-from typing import List
+import asyncio
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 
 import fixtures
 import telegram
 from telegram import ext, ReplyKeyboardMarkup, KeyboardButton, Message
-from datetime import datetime, timedelta
+from telegram.request import HTTPXRequest
+from datetime import date, datetime, timedelta
 
-import json_readers
-import player
+import leagues
+import metrics
+import outbound
+import web_scrapping
 
+KEYBOARD_CACHE_SIZE = 1024  # Rendered fixture keyboards kept, keyed by (date, player)
+HISTORY_COMMANDS = ["leaderboard", "progress", "accuracy", "teams", "h2h"]  # Bot commands answered from the history
+DEFAULT_LEADERBOARD_DAYS = 7
 
-def handle_received_message(update: telegram.Update, context: ext.CallbackContext) -> None:
-    """Handle message and respond according to included text."""
+HANDLER_SECONDS = metrics.histogram("bot_handler_seconds", "Time spent handling a received message, by branch.")
+TELEGRAM_API_SECONDS = metrics.histogram("telegram_api_seconds", "Latency of Telegram Bot API calls, by method.")
+TELEGRAM_API_FAILURES = metrics.counter("telegram_api_failures", "Telegram Bot API calls that failed, by method.")
+KEYBOARD_CACHE_REQUESTS = metrics.counter("keyboard_cache_requests", "Fixture keyboard requests by cache hit or miss.")
+
+_keyboard_cache: "OrderedDict[Tuple[date, str], Tuple[Tuple[int, int], ReplyKeyboardMarkup]]" = OrderedDict()
+
+
+def message_branch(received_text: str) -> str:
+    """Name of the branch of handle_received_message that handles the passed text, for metrics."""
+    text = received_text.lower()
+    if text in ("start", "score", "fixtures", "next day"):
+        return text.replace(" ", "_")
+    return "exit" if "exit" in text else "bet"
+
+
+async def handle_received_message(update: telegram.Update, context: ext.ContextTypes.DEFAULT_TYPE) -> None:
+    """Handle message and respond according to included text, timing each branch."""
+    with HANDLER_SECONDS.time(branch=message_branch(update.message.text)):
+        await _handle_received_message(update, context)
+
+
+async def _handle_received_message(update: telegram.Update, context: ext.ContextTypes.DEFAULT_TYPE) -> None:
     received_text = update.message.text
     bot = context.bot
+    chat_id = update.effective_chat.id
+    keyboard_key = (update.message.from_user["id"], "keyboard")  # A newer keyboard replaces an unsent one
     if received_text.lower() == "start":  # Start Bot Session send menu including "Fixtures" and "Score"
-        update.message.reply_text(text="Starting Bot...", reply_markup=get_inline_keyboard())
-        bot.delete_message(chat_id=update.effective_chat.id, message_id=update.message.message_id)
+        outbound.queue.reply(update.message, text="Starting Bot...", reply_markup=get_inline_keyboard(),
+                             replace_key=keyboard_key)
+        outbound.queue.delete(bot, chat_id, update.message.message_id)
     elif "exit" in received_text.lower():  # Exit Bot Session send menu including "Fixtures" and "Score"
         previous_message = update.message.reply_to_message
-        message_to_be_deleted = update.message.reply_text(text="Dummy reply message to end session",
-                                                          reply_markup=telegram.ReplyKeyboardRemove(selective=True))
-        bot.delete_message(chat_id=update.effective_chat.id, message_id=update.message.message_id)
-        bot.delete_message(chat_id=message_to_be_deleted.chat_id, message_id=message_to_be_deleted.message_id)
-        bot.delete_message(chat_id=previous_message.chat_id, message_id=previous_message.message_id)
+        outbound.queue.reply(update.message, text="Dummy reply message to end session",
+                             reply_markup=telegram.ReplyKeyboardRemove(selective=True), delete_after_send=True)
+        outbound.queue.delete(bot, chat_id, update.message.message_id)
+        outbound.queue.delete(bot, previous_message.chat_id, previous_message.message_id)
     elif received_text.lower() == 'score':  # Send current prediction score as a message
         previous_message = update.message.reply_to_message
-        telegram_bot_send_score(bot, update=update)
-        bot.delete_message(chat_id=update.effective_chat.id, message_id=update.message.message_id)
-        bot.delete_message(chat_id=previous_message.chat_id, message_id=previous_message.message_id)
+        await telegram_bot_send_score(bot, update=update)
+        outbound.queue.delete(bot, chat_id, update.message.message_id)
+        outbound.queue.delete(bot, previous_message.chat_id, previous_message.message_id)
     elif received_text.lower() == "fixtures":  # Send Fixtures Menu and allow players to bet by clicking on button
+        # Fixtures are kept in sync by the background refresh job, so no scraping happens here.
         previous_message = update.message.reply_to_message
-        fixtures_list = fixtures.get_fixtures()
-        update.message.reply_text(text=f"Fixtures for {datetime.today().strftime('%d.%m.%Y')}",
-                                  reply_markup=generate_fixture_keyboard_markup(fixtures_list, update,
-                                                                                date_to_filter=datetime.today()))
-        bot.delete_message(chat_id=update.effective_chat.id, message_id=update.message.message_id)
-        bot.delete_message(chat_id=previous_message.chat_id, message_id=previous_message.message_id)
-        fixtures.write_fixtures(fixtures_list)
+        today = fixtures.now()
+        outbound.queue.reply(update.message, text=f"Fixtures for {today.strftime('%d.%m.%Y')}",
+                             reply_markup=generate_fixture_keyboard_markup(update, date_to_filter=today),
+                             replace_key=keyboard_key)
+        outbound.queue.delete(bot, chat_id, update.message.message_id)
+        outbound.queue.delete(bot, previous_message.chat_id, previous_message.message_id)
     elif received_text.lower() == "next day":
-        fixtures_list = fixtures.load_fixtures()
         previous_message = update.message.reply_to_message
         previous_date = datetime.strptime(previous_message.text[previous_message.text.rindex(" "):].strip(), '%d.%m.%Y')
         next_date = previous_date + timedelta(days=1)
-        update.message.reply_text(text=f"Fixtures for {next_date.strftime('%d.%m.%Y')}",
-                                  reply_markup=generate_fixture_keyboard_markup(fixtures_list, update, next_date))
-        bot.delete_message(chat_id=update.effective_chat.id, message_id=update.message.message_id)
-        bot.delete_message(chat_id=previous_message.chat_id, message_id=previous_message.message_id)
+        outbound.queue.reply(update.message, text=f"Fixtures for {next_date.strftime('%d.%m.%Y')}",
+                             reply_markup=generate_fixture_keyboard_markup(update, next_date),
+                             replace_key=keyboard_key)
+        outbound.queue.delete(bot, chat_id, update.message.message_id)
+        outbound.queue.delete(bot, previous_message.chat_id, previous_message.message_id)
     else:
-        fixtures_list = fixtures.load_fixtures()
         previous_message = None
         if "for" in received_text:
             previous_message = update.message.reply_to_message
-        if ((received_text in ([x.home_team for x in fixtures_list] + [x.away_team for x in fixtures_list]))
-                or ('X' in received_text and received_text[received_text.index('\n') + 1:] in [x.id for x in
-                                                                                               fixtures_list])):
+        if ((received_text in fixtures.get_team_names())
+                or ('X' in received_text and fixtures.fixture_exists(received_text[received_text.index('\n') + 1:]))):
             previous_message = update.message.reply_to_message
             previous_date = datetime.strptime(previous_message.text[previous_message.text.rindex(" "):].strip(),
                                               '%d.%m.%Y')
-            temp_fixtures_list = select_fixtures(fixtures_list, previous_date)
-            player_string = json_readers.get_player_name_by_id(update.message.from_user["id"])
+            temp_fixtures_list = select_fixtures(previous_date)
+            player_string = leagues.get_league(chat_id).get_player_key_by_id(update.message.from_user["id"])
             if 'x' not in received_text.lower() and '\n' not in received_text.lower():
                 bet_fixture = \
                     [x for x in temp_fixtures_list if x.home_team == received_text or x.away_team == received_text][0]
                 if bet_fixture.predictions_dict[player_string] == "":
-                    bet_fixture.predictions_dict[player_string] = '1' if received_text in [x.home_team for x in
-                                                                                           temp_fixtures_list] else '2'
+                    await asyncio.to_thread(fixtures.set_prediction, bet_fixture, player_string,
+                                            '1' if received_text in [x.home_team for x in temp_fixtures_list] else '2')
             else:
                 match_id = received_text[received_text.index('\n') + 1:]
                 bet_fixture = [x for x in temp_fixtures_list if x.id == match_id][0]
                 if bet_fixture.predictions_dict[player_string] == "":
-                    bet_fixture.predictions_dict[player_string] = 'X'
-            fixtures.write_fixtures(fixtures_list)
-            update.message.reply_text(text=f"Fixtures for {previous_date.strftime('%d.%m.%Y')}",
-                                      reply_markup=generate_fixture_keyboard_markup(fixtures_list, update,
-                                                                                    previous_date))
-        bot.delete_message(chat_id=update.effective_chat.id, message_id=update.message.message_id)
+                    await asyncio.to_thread(fixtures.set_prediction, bet_fixture, player_string, 'X')
+            outbound.queue.reply(update.message, text=f"Fixtures for {previous_date.strftime('%d.%m.%Y')}",
+                                 reply_markup=generate_fixture_keyboard_markup(update, previous_date),
+                                 replace_key=keyboard_key)
+        outbound.queue.delete(bot, chat_id, update.message.message_id)
         if previous_message is not None:
-            bot.delete_message(chat_id=previous_message.chat_id, message_id=previous_message.message_id)
+            outbound.queue.delete(bot, previous_message.chat_id, previous_message.message_id)
+
 
+class InstrumentedRequest(HTTPXRequest):
+    """Bot API request backend that records the latency and failures of every call by API method."""
 
-def select_fixtures(fixtures_list, filter_datetime: datetime) -> List[fixtures.Fixture]:
-    """Returns fixtures from fixtures_list that are on the same day of the passed datetime_filter"""
+    async def do_request(self, url: str, method: str, *args, **kwargs) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        try:
+            with TELEGRAM_API_SECONDS.time(method=api_method):
+                code, payload = await super().do_request(url, method, *args, **kwargs)
+        except telegram.error.TelegramError:
+            TELEGRAM_API_FAILURES.inc(method=api_method)
+            raise
+        if code >= 400:
+            TELEGRAM_API_FAILURES.inc(method=api_method)
+        return code, payload
 
-    def check_same_day(test: fixtures.Fixture):
-        """True if fixture is on the same day, else false."""
-        if filter_datetime.day == test.match_datetime.day \
-                and filter_datetime.month == test.match_datetime.month \
-                and filter_datetime.year == test.match_datetime.year:
-                #and filter_datetime.hour < test.match_datetime.hour \
-                #and filter_datetime.minute < test.match_datetime.minute:
-            return True
-        return False
 
-    fixtures_list = [x for x in fixtures_list if check_same_day(x)]
-    fixtures_list.sort(key=fixtures.sort_key)
-    return fixtures_list
+def select_fixtures(filter_datetime: datetime) -> List[fixtures.Fixture]:
+    """Returns indexed fixtures that are on the same day of the passed datetime_filter, sorted by their datetime."""
+    return fixtures.fixtures_of_day(filter_datetime)
 
 
-def telegram_bot_send_score(bot: telegram.Bot, update: telegram.Update = None, chat_id=None) -> Message:
-    """Send score via Telegram API"""
-    players = player.create_player_objects(*json_readers.get_player_data_and_player_tables())
-    message = "".join([x.generate_telegram_string() for x in players])
+async def telegram_bot_send_score(bot: telegram.Bot, update: telegram.Update = None,
+                                  chat_id=None) -> List["asyncio.Future[Optional[Message]]"]:
+    """
+    Queues the score of the chat's league, scored against the shared league table, split into as many messages as its
+    length requires. Returns the futures of the queued messages.
+    """
     bot_chat_id = update.effective_chat.id if update is not None else chat_id
-    text = f"Update {datetime.today().strftime('%d.%m.%Y')}\n\n" \
-           f"{message}"
-    json_readers.update_players_scores(players) if len(players) > 0 else None
-    return bot.sendMessage(bot_chat_id, text)
+    league = leagues.get_league(bot_chat_id)
+    tabledata = await web_scrapping.get_table()
+    if league.leaderboard.update(tabledata, *league.get_player_data_and_player_tables()):
+        await asyncio.to_thread(league.leaderboard.persist)
+        await asyncio.to_thread(archive_scores, league)
+    text = f"Update {fixtures.now().strftime('%d.%m.%Y')}\n\n" \
+           f"{league.leaderboard.message}" \
+           f"{await asyncio.to_thread(format_combined_scores, league)}"
+    return [outbound.queue.send(bot, bot_chat_id, page) for page in outbound.paginate(text)]
+
+
+def format_combined_scores(league: leagues.League) -> str:
+    """The league's table scores combined with the points of their settled 1/X/2 predictions."""
+    import settlement  # Its NumPy dependency is loaded with the leaderboard's, not at startup
+    settlement.settle_indexed_fixtures()
+    board = league.leaderboard
+    rows = settlement.combine(settlement.engine.standings(), board.names, [league.player_key(x) for x in board.names],
+                              board.scores, fixtures.now().date())
+    lines = [f"{x.name.upper()} {x.total} (table {x.table_score}, predictions -{x.points}, "
+             f"this week {x.week_points}, streak {x.current_streak})" for x in rows]
+    return "TOTAL\n" + "\n".join(lines) if lines else ""
+
+
+def archive_scores(league: leagues.League) -> None:
+    """Appends the league's freshly computed scores to the season history."""
+    import history  # Its NumPy dependency is loaded with the leaderboard's, not at startup
+    history.archive.append_scores(league.namespace, [league.player_key(x) for x in league.leaderboard.names],
+                                  league.leaderboard.scores, fixtures.now())
+
+
+def format_history(command: str, args: List[str], league: leagues.League, player_key: Optional[str]) -> str:
+    """Answers a history command of a player of the league with the text of the reply."""
+    import history
+    archive = history.archive
+    if command == "leaderboard":
+        days = int(args[0]) if args and args[0].isdigit() else DEFAULT_LEADERBOARD_DAYS
+        end = fixtures.now()
+        rows = archive.leaderboard(league.namespace, end - timedelta(days=days), end)
+        lines = [f"{index}. {x.player} {x.score} ({x.change:+d})" for index, x in enumerate(rows, start=1)]
+        return f"Leaderboard of the last {days} days\n\n" + ("\n".join(lines) or "No scores recorded yet.")
+    if player_key is None:
+        return "Only players of this group have a history."
+    if command == "progress":
+        lines = [f"{timestamp.strftime('%d.%m.%Y %H:%M')} {score}" for timestamp, score in
+                 archive.score_history(player_key)]
+        return "Score history\n\n" + ("\n".join(lines) or "No scores recorded yet.")
+    if command == "accuracy":
+        lines = []
+        for x in archive.accuracy(league.namespace):
+            picks = ", ".join(f"{pick}: {hits}/{total}"
+                              for pick, hits, total in zip(history.PICKS, x.pick_hits, x.pick_predictions))
+            lines.append(f"{x.player} {x.hits}/{x.predictions} ({picks})")
+        return "Prediction accuracy\n\n" + ("\n".join(lines) or "No settled predictions yet.")
+    if command == "teams":
+        lines = [f"{x.team} {x.hits}/{x.predictions}" for x in archive.team_accuracy(player_key)]
+        return "Prediction accuracy by team\n\n" + ("\n".join(lines) or "No settled predictions yet.")
+    if not args:
+        return "Usage: /h2h <player>"
+    opponent = " ".join(args)
+    result = archive.head_to_head(player_key, league.player_key(opponent))
+    return f"Head to head with {opponent} over {result.fixtures} fixtures\n\n" \
+           f"Both right: {result.both}\nOnly you: {result.first_only}\nOnly {opponent}: {result.second_only}\n" \
+           f"Neither: {result.neither}"
+
+
+async def handle_history_command(update: telegram.Update, context: ext.ContextTypes.DEFAULT_TYPE) -> None:
+    """Replies to a history command with statistics of the chat's league over the archived seasons."""
+    command = update.message.text.split()[0].lstrip("/").split("@")[0].lower()
+    with HANDLER_SECONDS.time(branch=command):
+        league = leagues.get_league(update.effective_chat.id)
+        player_key = league.get_player_key_by_id(update.message.from_user["id"])
+        text = await asyncio.to_thread(format_history, command, context.args or [], league, player_key)
+        for page in outbound.paginate(text):
+            outbound.queue.reply(update.message, page)
 
 
 def get_inline_keyboard() -> ReplyKeyboardMarkup:
@@ -119,13 +222,31 @@ def get_inline_keyboard() -> ReplyKeyboardMarkup:
     return reply_markup
 
 
-def generate_fixture_keyboard_markup(fixtures_list: List[fixtures.Fixture], update: telegram.Update,
-                                     date_to_filter: datetime) -> telegram.replykeyboardmarkup:
+def generate_fixture_keyboard_markup(update: telegram.Update, date_to_filter: datetime) -> ReplyKeyboardMarkup:
+    """
+    Returns the fixture keyboard of date_to_filter for the sending player of the chat's league. Keyboards are cached per
+    (date, player) and only rebuilt when that day's fixtures or that player's predictions on that day change.
+    """
+    username = leagues.get_league(update.effective_chat.id).get_player_key_by_id(update.message.from_user["id"])
+    key = (date_to_filter.date(), username)
+    versions = fixtures.get_index().versions(*key)
+    cached = _keyboard_cache.get(key)
+    if cached is not None and cached[0] == versions:
+        KEYBOARD_CACHE_REQUESTS.inc(result="hit")
+        _keyboard_cache.move_to_end(key)
+        return cached[1]
+    KEYBOARD_CACHE_REQUESTS.inc(result="miss")
+    reply_markup = render_fixture_keyboard_markup(select_fixtures(date_to_filter), username, date_to_filter)
+    _keyboard_cache[key] = (versions, reply_markup)
+    if len(_keyboard_cache) > KEYBOARD_CACHE_SIZE:
+        _keyboard_cache.popitem(last=False)
+    return reply_markup
+
+
+def render_fixture_keyboard_markup(fixtures_list: List[fixtures.Fixture], username: str,
+                                   date_to_filter: datetime) -> ReplyKeyboardMarkup:
     """Iterate through passed fixtures and generate a ReplyKeyboardMarkup according to them and player bets."""
-    fixtures_list = select_fixtures(fixtures_list, date_to_filter)
     keyboard = []
-    # print(update.message.from_user["id"])
-    username = json_readers.get_player_name_by_id(update.message.from_user["id"])
     for fixture in fixtures_list:
         keyboard.append(
             [KeyboardButton(f"{fixture.home_team}⚽️") if fixture.predictions_dict[username] == '1'
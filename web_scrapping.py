@@ -1,13 +1,128 @@
-from typing import List
+import asyncio
+import json
+import logging
+import time
+from typing import List, Callable, Optional, Awaitable
 
-from requests_html import HTMLSession
+import httpx
 
-PREMIER_LEAGUE_TABLE_URL = 'https://www.skysports.com/premier-league-table'
+import http_client
+import metrics
+import state_persistence
 
+TABLE_SNAPSHOT_FILE = 'table_snapshot.json'
+TABLE_CACHE_TTL = 15 * 60  # Seconds a scraped table is served before a background refresh is triggered
 
-def web_scrape_table() -> List[str]:
-    """Scrapes the web using requests_html for the premier league table and returns the name column as is. """
-    request = HTMLSession().get(PREMIER_LEAGUE_TABLE_URL)
-    table = request.html.find('table')[0]
+TABLE_CACHE_REQUESTS = metrics.counter("table_cache_requests",
+                                       "League table requests by whether the snapshot was fresh, stale or missing.")
+
+
+def parse_table_html(html: str) -> List[str]:
+    """Parses the skysports premier league table page using requests_html and returns the name column as is."""
+    from requests_html import HTML  # Imported on first use, it pulls in a headless browser stack
+    table = HTML(html=html).find('table')[0]
     tabledata = [[c.text for c in row.find('td')[1:][:-9]] for row in table.find('tr')[1:]]
     return [x for sublist in tabledata for x in sublist]
+
+
+async def web_scrape_table() -> List[str]:
+    """Fetches the premier league table through the shared HTTP client and parses it in the parser process pool."""
+    import sources  # The source registry refers to this module's parser, so it is imported once both are loaded
+    return await sources.scrape_table(sources.PREMIER_LEAGUE)
+
+
+class TableSnapshotProvider:
+    """
+    Shared, in-memory cache of the scraped league table.
+
+    The table is fetched once and served to every caller until it is older than `ttl`. Stale tables are still served
+    while a single background task revalidates them. The last good snapshot is persisted to `snapshot_file` so that a
+    restart or an upstream outage still has standings to serve.
+    """
+
+    def __init__(self, scraper: Callable[[], Awaitable[List[str]]] = web_scrape_table, ttl: float = TABLE_CACHE_TTL,
+                 snapshot_file: Optional[str] = TABLE_SNAPSHOT_FILE):
+        self.scraper = scraper
+        self.ttl: float = ttl
+        self.snapshot_file: Optional[str] = snapshot_file
+        self.table: List[str] = []
+        self.fetched_at: float = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._loaded_from_disk: bool = False
+
+    async def get_table(self) -> List[str]:
+        """Returns the cached table, scraping before returning only when no snapshot is available at all."""
+        if not self.table and not self._loaded_from_disk:
+            await asyncio.to_thread(self.load_snapshot)
+        if not self.table:
+            TABLE_CACHE_REQUESTS.inc(result="miss")
+            return list(await self.refresh())
+        if self.is_stale():
+            TABLE_CACHE_REQUESTS.inc(result="stale")
+            self.refresh_in_background()
+        else:
+            TABLE_CACHE_REQUESTS.inc(result="hit")
+        return list(self.table)
+
+    def is_stale(self) -> bool:
+        """True if the cached table is older than the configured ttl."""
+        return time.time() - self.fetched_at > self.ttl
+
+    async def refresh(self) -> List[str]:
+        """
+        Scrapes the table and replaces the snapshot. On failure the previous snapshot is kept and returned.
+        Concurrent callers share the refresh that is already in flight.
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh())
+        return await asyncio.shield(self._refresh_task)
+
+    async def _refresh(self) -> List[str]:
+        try:
+            table = await self.scraper()
+        except (httpx.HTTPError, ConnectionError, IndexError):
+            http_client.SCRAPE_FAILURES.inc(source="table")
+            logging.exception("Failed to scrape the league table, serving the last known snapshot.")
+            return self.table
+        if table:
+            self.table = table
+            self.fetched_at = time.time()
+            await asyncio.to_thread(self.save_snapshot)
+        return self.table
+
+    def refresh_in_background(self) -> None:
+        """Starts a revalidation task unless one is already running."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh())
+
+    def load_snapshot(self) -> None:
+        """Loads the last persisted snapshot from disk, if any."""
+        self._loaded_from_disk = True
+        if self.snapshot_file is None:
+            return
+        try:
+            with open(self.snapshot_file, encoding="utf8") as file:
+                snapshot: dict = json.load(file)
+            self.table = snapshot["table"]
+            self.fetched_at = snapshot["fetched_at"]
+        except (IOError, FileNotFoundError, json.decoder.JSONDecodeError, KeyError):
+            pass
+
+    def save_snapshot(self) -> None:
+        """Persists the current snapshot to disk."""
+        if self.snapshot_file is None:
+            return
+        try:
+            state_persistence.atomic_write_json(self.snapshot_file,
+                                                {"fetched_at": self.fetched_at, "table": self.table},
+                                                ensure_ascii=False, indent=4)
+        except IOError:
+            logging.exception("Failed to persist the league table snapshot.")
+
+
+table_provider = TableSnapshotProvider()
+
+
+async def get_table() -> List[str]:
+    """Returns the shared league table snapshot."""
+    return await table_provider.get_table()